@@ -1,29 +1,214 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import atexit
+import bisect
+import codecs
+import hashlib
+import heapq
+import itertools
 import logging
+import logging.handlers
 import os
+import queue
+import json
+import random
+import re
+import signal
+import subprocess
+import sys
+import sqlite3
+import threading
 
 import time
 import datetime
-import requests
-import telegram
-
-from telegram import Bot
+from collections import Counter as Tally, OrderedDict, deque
 
-from dotenv import load_dotenv
+from concurrent.futures import (FIRST_COMPLETED, Future, ThreadPoolExecutor,
+                                wait)
+from dataclasses import dataclass, field, fields, replace
+from email.utils import parsedate_to_datetime
+from enum import Enum
 from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from typing import (TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List,
+                    Mapping, Optional, Set, Tuple, Union)
+
+if TYPE_CHECKING:
+    import requests
+    from telegram import Bot
+    from telegram.ext import Updater
+
+
+class ConfigError(ValueError):
+    """Неверные значения переменных окружения."""
+
+
+def parse_bool(value: str) -> bool:
+    """Разбирает логическое значение переменной окружения."""
+    values = {'1': True, 'true': True, 'yes': True, 'on': True,
+              '0': False, 'false': False, 'no': False, 'off': False}
+    return values[value.lower()]
+
+
+ENV_TYPES: Dict[str, Callable] = {
+    'str': str, 'Optional[str]': str, 'int': int, 'Optional[int]': int,
+    'float': float, 'bool': parse_bool,
+}
+
+
+# Переменные, которые load_dotenv() добавил в os.environ из .env.
+DOTENV_KEYS: Set[str] = set()
+
+
+@dataclass(frozen=True)
+class Config:
+    """Настройки бота из переменных окружения.
+
+    Переменная окружения называется как поле в верхнем регистре, пустое
+    значение равно отсутствующему. from_env() приводит значения к типам
+    полей и сообщает обо всех ошибках сразу; problems() проверяет
+    согласованность настроек до запуска бота.
+    """
+
+    practicum_token: Optional[str] = None
+    telegram_token: Optional[str] = None
+    telegram_chat_id: Optional[str] = None
+    tenants_file: Optional[str] = None
+    shard_index: int = 0
+    shard_count: int = 1
+    state_file: Optional[str] = None
+    outbox_file: Optional[str] = None
+    record_file: Optional[str] = None
+    homework_statuses_file: Optional[str] = None
+    retry_time: int = 6
+    max_retry_time: int = 600
+    reviewing_retry_time: int = 60
+    telegram_global_rate: float = 30
+    telegram_chat_rate: float = 1
+    telegram_max_retries: int = 5
+    breaker_failures: int = 5
+    breaker_reset_time: float = 60
+    poll_start_rate: float = 100
+    poll_workers: int = 4
+    send_workers: int = 2
+    send_queue_size: int = 1000
+    send_drain_timeout: float = 20
+    bot_engine: str = 'sync'
+    max_concurrency: int = 100
+    stream_responses: bool = False
+    http_pool_size: int = 10
+    request_timeout: float = 10
+    metrics_port: Optional[int] = None
+    status_cache_size: int = 10000
+    status_cache_ttl: float = 86400
+    bot_commands: bool = False
+    log_file: str = 'main.log'
+    log_format: str = 'text'
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backup_count: int = 5
+    log_rotate_when: Optional[str] = None
+    profile_dir: str = '.'
+
+    CHOICES = {'bot_engine': ('sync', 'async'), 'log_format': ('text', 'json')}
+    POSITIVE = ('retry_time', 'shard_count', 'poll_workers', 'send_workers',
+                'max_concurrency', 'http_pool_size', 'request_timeout',
+                'telegram_global_rate', 'telegram_chat_rate',
+                'poll_start_rate')
+
+    @classmethod
+    def from_env(cls, environ: Optional[Mapping[str, str]] = None) -> Config:
+        """Читает настройки из environ, по умолчанию - из os.environ и .env.
 
-from typing import Dict, List, Optional
+        При неразборчивых значениях бросает ConfigError со списком
+        всех неверных переменных.
+        """
+        if environ is None:
+            from dotenv import load_dotenv
 
-load_dotenv()
+            before = set(os.environ)
+            load_dotenv()
+            DOTENV_KEYS.update(set(os.environ) - before)
+            environ = os.environ
+        values, errors = {}, []
+        for item in fields(cls):
+            name = item.name.upper()
+            raw = environ.get(name)
+            if not raw:
+                continue
+            try:
+                values[item.name] = ENV_TYPES[item.type](raw)
+            except (KeyError, ValueError):
+                errors.append(f'{name}={raw!r}: ожидается {item.type}')
+        for name, choices in cls.CHOICES.items():
+            if values.get(name, choices[0]) not in choices:
+                errors.append(f'{name.upper()}={values[name]!r}: '
+                              f'допустимо {", ".join(choices)}')
+        if errors:
+            raise ConfigError('Неверные переменные окружения: '
+                              + '; '.join(errors))
+        return cls(**values)
 
+    def problems(self) -> List[str]:
+        """Возвращает описания несогласованных настроек."""
+        problems = [f'{name.upper()} должно быть больше нуля'
+                    for name in self.POSITIVE if getattr(self, name) <= 0]
+        if not 0 <= self.shard_index < self.shard_count:
+            problems.append('SHARD_INDEX должен быть от 0 до SHARD_COUNT - 1')
+        if self.max_retry_time < self.retry_time:
+            problems.append('MAX_RETRY_TIME меньше RETRY_TIME')
+        if self.record_file and self.stream_responses:
+            problems.append('RECORD_FILE несовместим с STREAM_RESPONSES: '
+                            'запись читает ответ API целиком')
+        return problems
 
-PRACTICUM_TOKEN = os.getenv('PRACTICUM_TOKEN')
-TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
-TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 
+CONFIG = Config.from_env()
 
-RETRY_TIME: int = 6
+
+PRACTICUM_TOKEN = CONFIG.practicum_token
+TELEGRAM_TOKEN = CONFIG.telegram_token
+TELEGRAM_CHAT_ID = CONFIG.telegram_chat_id
+TENANTS_FILE = CONFIG.tenants_file
+SHARD_INDEX: int = CONFIG.shard_index
+SHARD_COUNT: int = CONFIG.shard_count
+STATE_FILE = CONFIG.state_file
+OUTBOX_FILE = CONFIG.outbox_file
+RECORD_FILE = CONFIG.record_file
+HOMEWORK_STATUSES_FILE = CONFIG.homework_statuses_file
+
+
+RETRY_TIME: int = CONFIG.retry_time
+MAX_RETRY_TIME: int = CONFIG.max_retry_time
+REVIEWING_RETRY_TIME: int = CONFIG.reviewing_retry_time
+BACKOFF_FACTOR: float = 2.0
+JITTER: float = 0.1
+TELEGRAM_GLOBAL_RATE: float = CONFIG.telegram_global_rate
+TELEGRAM_CHAT_RATE: float = CONFIG.telegram_chat_rate
+TELEGRAM_MAX_RETRIES: int = CONFIG.telegram_max_retries
+TELEGRAM_MESSAGE_LIMIT: int = 4096
+BREAKER_FAILURES: int = CONFIG.breaker_failures
+BREAKER_RESET_TIME: float = CONFIG.breaker_reset_time
+POLL_WORKERS: int = CONFIG.poll_workers
+POLL_START_RATE: float = CONFIG.poll_start_rate
+SEND_WORKERS: int = CONFIG.send_workers
+SEND_QUEUE_SIZE: int = CONFIG.send_queue_size
+SEND_DRAIN_TIMEOUT: float = CONFIG.send_drain_timeout
+BOT_ENGINE: str = CONFIG.bot_engine
+MAX_CONCURRENCY: int = CONFIG.max_concurrency
+STREAM_RESPONSES: bool = CONFIG.stream_responses
+STREAM_CHUNK_SIZE: int = 64 * 1024
+HTTP_POOL_SIZE: int = CONFIG.http_pool_size
+REQUEST_TIMEOUT: float = CONFIG.request_timeout
+METRICS_PORT: Optional[int] = CONFIG.metrics_port
+STATUS_CACHE_SIZE: int = CONFIG.status_cache_size
+STATUS_CACHE_TTL: float = CONFIG.status_cache_ttl
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+BOT_COMMANDS: bool = CONFIG.bot_commands
+STATUS_LIMIT: int = 10
 ENDPOINT: str = 'https://practicum.yandex.ru/api/user_api/homework_statuses/'
-HEADERS = {'Authorization': f'OAuth {PRACTICUM_TOKEN}'}
 
 
 HOMEWORK_STATUSES = {
@@ -32,142 +217,3147 @@ HOMEWORK_STATUSES = {
     'rejected': 'Работа проверена: у ревьюера есть замечания.',
 }
 
+DEFAULT_HOMEWORK_STATUSES = dict(HOMEWORK_STATUSES)
+
 TEXTMESSAGE: str = 'Изменился статус проверки работы'
+ERRORMESSAGE: str = 'Сбой в работе программы'
+RECOVERYMESSAGE: str = 'Работа программы восстановлена.'
+
+
+LOG_FILE: str = CONFIG.log_file
+LOG_FORMAT: str = CONFIG.log_format
+LOG_MAX_BYTES: int = CONFIG.log_max_bytes
+LOG_BACKUP_COUNT: int = CONFIG.log_backup_count
+LOG_ROTATE_WHEN: Optional[str] = CONFIG.log_rotate_when
+LOG_EXTRA_FIELDS = ('tenant', 'homework_id', 'latency')
+PROFILE_DIR: str = CONFIG.profile_dir
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись лога как JSON-объект в одну строку.
+
+    Помимо времени, уровня, имени логгера и сообщения переносит поля
+    tenant, homework_id и latency, переданные через extra.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Возвращает запись в виде JSON."""
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'name': record.name,
+            'message': record.getMessage(),
+        }
+        for name in LOG_EXTRA_FIELDS:
+            if hasattr(record, name):
+                data[name] = getattr(record, name)
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+def setup_logging(
+    filename: str = LOG_FILE, log_format: str = LOG_FORMAT,
+    level: int = logging.INFO
+) -> logging.handlers.QueueListener:
+    """Настраивает неблокирующее логирование с ротацией файла.
+
+    Корневой логгер пишет записи в очередь, а запись на диск выполняет
+    отдельный поток QueueListener. Файл ротируется по размеру
+    (LOG_MAX_BYTES) или, при заданном LOG_ROTATE_WHEN, по времени.
+
+    Ключевые аргументы:
+    filename -- файл лога,
+    log_format -- 'text' или 'json',
+    level -- уровень логирования
+    """
+    if LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            filename, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT,
+            encoding='utf-8'
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+            encoding='utf-8'
+        )
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s, %(levelname)s, %(name)s, %(message)s'
+        ))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level)
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric:
+    """Метрика в формате Prometheus со значениями по наборам меток.
+
+    Ключевые аргументы:
+    name -- имя метрики,
+    documentation -- описание для строки # HELP
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str):
+        """Создаёт метрику и регистрирует её в METRICS."""
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    @staticmethod
+    def _key(labels: Dict) -> Tuple:
+        return tuple(sorted(labels.items()))
+
+    @staticmethod
+    def _format_labels(key: Tuple, extra: str = '') -> str:
+        pairs = [f'{name}="{value}"' for name, value in key]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def samples(self) -> List[str]:
+        """Возвращает строки значений метрики."""
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{self._format_labels(key)} {value}'
+                for key, value in items]
+
+    def render(self) -> str:
+        """Возвращает метрику в текстовом формате Prometheus."""
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.kind}']
+        return '\n'.join(lines + self.samples())
+
+
+class Counter(Metric):
+    """Монотонно растущий счётчик."""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """Увеличивает счётчик для набора меток."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Текущее значение, которое читается функцией при выгрузке."""
+
+    kind = 'gauge'
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Задаёт функцию, возвращающую значение метрики."""
+        self._function = function
+
+    def samples(self) -> List[str]:
+        """Возвращает строку с текущим значением."""
+        function = getattr(self, '_function', None)
+        return [f'{self.name} {function()}'] if function else []
+
+
+class Histogram(Metric):
+    """Гистограмма значений с накопительными корзинами."""
+
+    kind = 'histogram'
 
+    def __init__(self, name: str, documentation: str,
+                 buckets: Tuple = LATENCY_BUCKETS):
+        """Создаёт гистограмму с верхними границами корзин buckets."""
+        super().__init__(name, documentation)
+        self.buckets = buckets
 
-logging.basicConfig(
-    level=logging.INFO,
-    filename='main.log',
-    format='%(asctime)s, %(levelname)s, %(name)s, %(message)s',
-    filemode='w'
+    def observe(self, value: float, **labels) -> None:
+        """Добавляет наблюдение для набора меток."""
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observed = self._values.get(
+                key, ([0] * len(self.buckets), 0.0, 0)
+            )
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value, observed + 1)
+
+    def time(self, **labels) -> 'Timer':
+        """Возвращает контекстный менеджер, замеряющий длительность."""
+        return Timer(self, labels)
+
+    def samples(self) -> List[str]:
+        """Возвращает строки корзин, суммы и количества."""
+        with self._lock:
+            items = [(key, list(counts), total, observed)
+                     for key, (counts, total, observed)
+                     in self._values.items()]
+        lines = []
+        for key, counts, total, observed in items:
+            bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+            for bound, count in zip(bounds, counts + [observed]):
+                labels = self._format_labels(key, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = self._format_labels(key)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {observed}')
+        return lines
+
+
+class Timer:
+    """Контекстный менеджер, пишущий длительность блока в гистограмму."""
+
+    def __init__(self, histogram: Histogram, labels: Dict):
+        """Создаёт замер для гистограммы histogram."""
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> 'Timer':
+        """Запоминает время начала блока."""
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Пишет длительность блока в гистограмму."""
+        self.histogram.observe(
+            time.perf_counter() - self.started, **self.labels
+        )
+
+
+METRICS: List[Metric] = []
+
+PRACTICUM_LATENCY = Histogram(
+    'practicum_request_seconds', 'Длительность запроса к API Практикума.'
+)
+PRACTICUM_RESPONSES = Counter(
+    'practicum_responses_total', 'Ответы API Практикума по HTTP-коду.'
+)
+PARSE_LATENCY = Histogram(
+    'parse_seconds', 'Длительность check_response и parse_status.'
+)
+HOMEWORKS_PARSED = Counter(
+    'homeworks_parsed_total', 'Домашние работы в ответах API.'
+)
+TELEGRAM_LATENCY = Histogram(
+    'telegram_send_seconds', 'Длительность отправки сообщения в Telegram.'
+)
+TELEGRAM_FAILURES = Counter(
+    'telegram_failures_total', 'Неудачные попытки отправки в Telegram.'
+)
+TELEGRAM_QUEUE_DEPTH = Gauge(
+    'telegram_queue_depth', 'Строки, ожидающие отправки в Telegram.'
 )
 
 
-def send_message(bot: Bot, *args) -> Bot:
-    """Отправляет в Telegram чат сообщение.
+def render_metrics() -> str:
+    """Возвращает все метрики в текстовом формате Prometheus."""
+    return '\n'.join(metric.render() for metric in METRICS) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Отдаёт render_metrics() по адресу /metrics."""
+
+    def do_GET(self):
+        """Обрабатывает запрос к /metrics."""
+        if self.path != '/metrics':
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        body = render_metrics().encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        """Не пишет каждый запрос к /metrics в лог."""
+
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer:
+    """Запускает HTTP-сервер метрик на localhost в фоновом потоке."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name='metrics', daemon=True
+    ).start()
+    logging.info(f'Метрики доступны на порту {server.server_port}.')
+    return server
+
+
+def token_key(token: str) -> str:
+    """Возвращает короткий хэш токена для ключей состояния и кассет."""
+    return hashlib.sha1(token.encode()).hexdigest()[:12]
+
+
+@dataclass
+class Tenant:
+    """Отслеживаемая пара: токен Практикума и чат Telegram.
 
     Ключевые аргументы:
-    bot -- экземпляр класса Bot,
-    message -- текстовое сообщение - тип str
+    name -- имя подписки, используется в логах,
+    practicum_token -- OAuth-токен API Практикум.Домашка,
+    chat_id -- чат Telegram для уведомлений,
+    from_date -- временная метка, с которой запрашиваются статусы,
+    interval -- текущий интервал опроса в секундах,
+    failures -- число сбоев подряд,
+    reviewing -- есть ли у подписки работа на проверке,
+    next_poll -- время следующего опроса по time.monotonic(),
+    followers -- другие чаты, получающие уведомления по этому токену,
+    alerted -- отправлено ли в чаты сообщение о текущем сбое,
+    paused -- чаты, приостановившие уведомления командой /pause,
+    poll_interval -- интервал опроса, заданный командой /interval
     """
-    try:
-        arg_name = bot.send_message(chat_id=args[0], text=args[1])
-        return arg_name
-    except Exception:
-        logging.error('Cбой при отправке сообщения в Telegram.')
 
+    name: str
+    practicum_token: str
+    chat_id: str
+    from_date: int = 0
+    interval: float = RETRY_TIME
+    failures: int = 0
+    reviewing: bool = False
+    next_poll: float = 0.0
+    followers: List[str] = field(default_factory=list)
+    alerted: bool = False
+    paused: List[str] = field(default_factory=list)
+    poll_interval: Optional[float] = None
 
-def get_api_answer(current_timestamp: int) -> Optional[Dict]:
-    """Возвращает ответ API.
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Заголовки запроса к API для токена подписки."""
+        return {'Authorization': f'OAuth {self.practicum_token}'}
+
+    @property
+    def key(self) -> str:
+        """Ключ курсора, статусов и кэша ответов - хэш токена.
+
+        В отличие от имени, он не меняется, когда записи реестра с общим
+        токеном переставляют или удаляют (см. group_tenants()).
+        """
+        return token_key(self.practicum_token)
+
+    @property
+    def chat_ids(self) -> List[str]:
+        """Все чаты, в которые отправляются уведомления подписки."""
+        return [self.chat_id] + self.followers
+
+    @property
+    def active_chat_ids(self) -> List[str]:
+        """Чаты подписки, не приостановившие уведомления."""
+        return [chat for chat in self.chat_ids if chat not in self.paused]
+
+
+def load_tenants(path: str) -> List[Tenant]:
+    """Загружает реестр подписок из JSON-файла или базы SQLite.
+
+    Файл с расширением .db/.sqlite/.sqlite3 читается как база SQLite
+    с таблицей tenants(name, practicum_token, chat_id), любой другой -
+    как JSON-список объектов с теми же ключами.
+    """
+    if path.endswith(SQLITE_SUFFIXES):
+        with sqlite3.connect(path) as connection:
+            rows = connection.execute(
+                'SELECT name, practicum_token, chat_id FROM tenants'
+            ).fetchall()
+        return [Tenant(str(name), token, str(chat)) for name, token, chat
+                in rows]
+    with open(path, encoding='utf-8') as file:
+        records = json.load(file)
+    return [
+        Tenant(
+            str(record.get('name', index)),
+            record['practicum_token'],
+            str(record['chat_id']),
+        )
+        for index, record in enumerate(records)
+    ]
+
+
+def group_tenants(tenants: List[Tenant]) -> List[Tenant]:
+    """Объединяет подписки с одинаковым токеном Практикума.
+
+    Токен опрашивается один раз, а чаты остальных подписок с этим
+    токеном добавляются в followers первой; повторяющиеся чаты
+    отбрасываются. Состояние группы хранится по Tenant.key, поэтому
+    порядок записей в реестре на него не влияет.
+    """
+    by_token: Dict[str, Tenant] = {}
+    for tenant in tenants:
+        first = by_token.setdefault(tenant.practicum_token, tenant)
+        if first is not tenant and tenant.chat_id not in first.chat_ids:
+            first.followers.append(tenant.chat_id)
+    if len(by_token) < len(tenants):
+        logging.info(f'Подписки объединены по токенам: {len(tenants)} '
+                     f'-> {len(by_token)}.')
+    return list(by_token.values())
+
+
+class HashRing:
+    """Консистентное хэширование ключей по шардам.
+
+    Каждый шард занимает replicas точек на кольце, поэтому при
+    изменении числа шардов переезжает лишь около 1/N ключей.
 
     Ключевые аргументы:
-    current_timestamp -- временная метка - текущее время,
-    params -- словарь параметров,
-    answer -- ответ, преобразованный из формата JSON к типам данных Python
+    shards -- число шардов,
+    replicas -- число виртуальных точек одного шарда
     """
-    params = {'from_date': current_timestamp}
 
-    homework_statuses = requests.get(ENDPOINT, headers=HEADERS, params=params)
-    if homework_statuses.status_code == HTTPStatus.OK:
-        answer = homework_statuses.json()
-        homework_statuses.status_code
-        return answer
-    else:
-        logging.error('API возвращает код, отличный от 200.')
-        raise ValueError
+    def __init__(self, shards: int, replicas: int = 100):
+        """Строит кольцо для shards шардов."""
+        points = sorted(
+            (self._hash(f'{shard}:{replica}'), shard)
+            for shard in range(shards) for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
 
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
 
-def check_response(response: Optional[Dict]):
-    """Функция возвращает список домашних работ.
+    def shard(self, key: str) -> int:
+        """Возвращает номер шарда для ключа key."""
+        index = bisect.bisect(self._hashes, self._hash(key))
+        return self._shards[index % len(self._shards)]
+
+
+def get_tenants() -> List[Tenant]:
+    """Возвращает подписки из TENANTS_FILE либо из переменных окружения.
+
+    Подписки с одинаковым токеном объединяются group_tenants().
+    В шардированном режиме (SHARD_COUNT > 1) остаются только подписки,
+    токены которых HashRing относит к шарду SHARD_INDEX.
+    """
+    if not TENANTS_FILE:
+        return [Tenant('default', PRACTICUM_TOKEN, TELEGRAM_CHAT_ID)]
+    tenants = group_tenants(load_tenants(TENANTS_FILE))
+    if SHARD_COUNT > 1:
+        ring = HashRing(SHARD_COUNT)
+        tenants = [tenant for tenant in tenants
+                   if ring.shard(tenant.practicum_token) == SHARD_INDEX]
+    return tenants
+
+
+class JsonStateStore:
+    """Хранилище курсоров и последних статусов в JSON-файле.
+
+    Файл читается при первом обращении, изменения копятся в памяти
+    и записываются методом flush() через временный файл и os.replace,
+    поэтому падение процесса не оставляет файл недописанным.
+    Без пути хранилище работает только в памяти.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """Создаёт хранилище, не читая файл."""
+        self.path = path
+        self._data = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict:
+        if self._data is None:
+            self._data = {'cursors': {}, 'statuses': {}}
+            if self.path and os.path.exists(self.path):
+                with open(self.path, encoding='utf-8') as file:
+                    self._data = json.load(file)
+        return self._data
+
+    def get_cursor(self, tenant: str) -> Optional[int]:
+        """Возвращает сохранённую временную метку подписки."""
+        with self._lock:
+            return self._load()['cursors'].get(tenant)
+
+    def set_cursor(self, tenant: str, from_date: int) -> None:
+        """Запоминает временную метку подписки."""
+        with self._lock:
+            self._load()['cursors'][tenant] = from_date
+            self._dirty = True
+
+    def get_status(self, tenant: str,
+                   homework_id) -> Optional[Tuple[str, Optional[str]]]:
+        """Возвращает последний статус и date_updated домашней работы."""
+        with self._lock:
+            record = self._load()['statuses'].get(tenant, {}).get(
+                str(homework_id)
+            )
+        return tuple(record) if record else None
+
+    def get_statuses(self, tenant: str,
+                     limit: int = STATUS_LIMIT) -> List[Tuple]:
+        """Возвращает до limit последних (id, status, date_updated)."""
+        with self._lock:
+            statuses = self._load()['statuses'].get(tenant, {})
+            records = [(homework_id, status, date_updated)
+                       for homework_id, (status, date_updated)
+                       in statuses.items()]
+        records.sort(key=lambda record: record[2] or '', reverse=True)
+        return records[:limit]
+
+    def set_status(self, tenant: str, homework_id, status: str,
+                   date_updated: Optional[str] = None) -> None:
+        """Запоминает статус домашней работы."""
+        with self._lock:
+            statuses = self._load()['statuses'].setdefault(tenant, {})
+            statuses[str(homework_id)] = [status, date_updated]
+            self._dirty = True
+
+    def flush(self) -> None:
+        """Атомарно записывает накопленные изменения в файл."""
+        with self._lock:
+            if not (self.path and self._dirty):
+                return
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(self._data, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+
+class SqliteStateStore:
+    """Хранилище курсоров и последних статусов в SQLite (режим WAL).
+
+    Соединение открывается при первом обращении в режиме автофиксации,
+    поэтому чтения не держат транзакцию. Изменения копятся в памяти и
+    записываются методом flush() одной короткой транзакцией
+    BEGIN IMMEDIATE ... COMMIT: несколько процессов (шардов) могут
+    делить одну базу, ожидая друг друга не дольше TIMEOUT секунд.
+    Если база так и не освободилась, изменения остаются в памяти до
+    следующего flush().
+    """
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS cursors ('
+        'tenant TEXT PRIMARY KEY, from_date INTEGER)',
+        'CREATE TABLE IF NOT EXISTS statuses ('
+        'tenant TEXT, homework_id TEXT, status TEXT, date_updated TEXT, '
+        'PRIMARY KEY (tenant, homework_id))',
+    )
+    TIMEOUT = 30
+
+    def __init__(self, path: str):
+        """Создаёт хранилище, не открывая базу."""
+        self.path = path
+        self._connection = None
+        self._cursors: Dict[str, int] = {}
+        self._statuses: Dict[Tuple[str, str], Tuple] = {}
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                self.path, timeout=self.TIMEOUT, isolation_level=None,
+                check_same_thread=False
+            )
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.SCHEMA:
+                self._connection.execute(statement)
+        return self._connection
+
+    def get_cursor(self, tenant: str) -> Optional[int]:
+        """Возвращает сохранённую временную метку подписки."""
+        with self._lock:
+            if tenant in self._cursors:
+                return self._cursors[tenant]
+            row = self._connect().execute(
+                'SELECT from_date FROM cursors WHERE tenant = ?', (tenant,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, tenant: str, from_date: int) -> None:
+        """Запоминает временную метку подписки."""
+        with self._lock:
+            self._cursors[tenant] = from_date
+
+    def get_status(self, tenant: str,
+                   homework_id) -> Optional[Tuple[str, Optional[str]]]:
+        """Возвращает последний статус и date_updated домашней работы."""
+        with self._lock:
+            record = self._statuses.get((tenant, str(homework_id)))
+            if record is not None:
+                return record
+            row = self._connect().execute(
+                'SELECT status, date_updated FROM statuses '
+                'WHERE tenant = ? AND homework_id = ?',
+                (tenant, str(homework_id))
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def get_statuses(self, tenant: str,
+                     limit: int = STATUS_LIMIT) -> List[Tuple]:
+        """Возвращает до limit последних (id, status, date_updated)."""
+        with self._lock:
+            rows = {row[0]: row for row in self._connect().execute(
+                'SELECT homework_id, status, date_updated FROM statuses '
+                'WHERE tenant = ? ORDER BY date_updated DESC LIMIT ?',
+                (tenant, limit)
+            )}
+            for (owner, homework_id), record in self._statuses.items():
+                if owner == tenant:
+                    rows[homework_id] = (homework_id, *record)
+        return sorted(rows.values(), key=lambda row: row[2] or '',
+                      reverse=True)[:limit]
+
+    def set_status(self, tenant: str, homework_id, status: str,
+                   date_updated: Optional[str] = None) -> None:
+        """Запоминает статус домашней работы."""
+        with self._lock:
+            self._statuses[(tenant, str(homework_id))] = (status,
+                                                          date_updated)
+
+    def flush(self) -> None:
+        """Записывает накопленные изменения одной транзакцией."""
+        with self._lock:
+            if not self._cursors and not self._statuses:
+                return
+            connection = self._connect()
+            try:
+                connection.execute('BEGIN IMMEDIATE')
+                connection.executemany(
+                    'INSERT OR REPLACE INTO cursors VALUES (?, ?)',
+                    self._cursors.items()
+                )
+                connection.executemany(
+                    'INSERT OR REPLACE INTO statuses VALUES (?, ?, ?, ?)',
+                    [(*key, *record)
+                     for key, record in self._statuses.items()]
+                )
+                connection.execute('COMMIT')
+            except sqlite3.OperationalError as e:
+                if connection.in_transaction:
+                    connection.execute('ROLLBACK')
+                logging.error(f'Состояние не записано в {self.path}: {e}')
+                return
+            self._cursors.clear()
+            self._statuses.clear()
+
+
+class StatusCache:
+    """LRU-кэш последних статусов поверх хранилища состояния.
+
+    Ключ - пара (подписка, id работы), значение - (status, date_updated).
+    Записи вытесняются по размеру и по времени жизни, промах кэша
+    читается из хранилища. Курсоры и flush() передаются хранилищу.
+    """
+
+    def __init__(self, store, maxsize: int = STATUS_CACHE_SIZE,
+                 ttl: float = STATUS_CACHE_TTL):
+        """Создаёт кэш над хранилищем store."""
+        self.store = store
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_cursor(self, tenant: str) -> Optional[int]:
+        """Возвращает сохранённую временную метку подписки."""
+        return self.store.get_cursor(tenant)
+
+    def set_cursor(self, tenant: str, from_date: int) -> None:
+        """Запоминает временную метку подписки."""
+        self.store.set_cursor(tenant, from_date)
+
+    def get_status(self, tenant: str,
+                   homework_id) -> Optional[Tuple[str, Optional[str]]]:
+        """Возвращает статус из кэша, а при промахе - из хранилища."""
+        key = (tenant, str(homework_id))
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] > now:
+                self._items.move_to_end(key)
+                return item[0]
+        value = self.store.get_status(tenant, homework_id)
+        if value is not None:
+            self._put(key, value, now)
+        return value
+
+    def get_statuses(self, tenant: str,
+                     limit: int = STATUS_LIMIT) -> List[Tuple]:
+        """Возвращает последние статусы подписки из хранилища."""
+        return self.store.get_statuses(tenant, limit)
+
+    def set_status(self, tenant: str, homework_id, status: str,
+                   date_updated: Optional[str] = None) -> None:
+        """Запоминает статус в кэше и в хранилище."""
+        self._put((tenant, str(homework_id)), (status, date_updated),
+                  time.monotonic())
+        self.store.set_status(tenant, homework_id, status, date_updated)
+
+    def _put(self, key, value, now: float) -> None:
+        with self._lock:
+            self._items[key] = (value, now + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def flush(self) -> None:
+        """Записывает изменения хранилища."""
+        self.store.flush()
+
+
+def open_state_store(path: Optional[str]):
+    """Возвращает хранилище состояния по пути из STATE_FILE.
+
+    Без пути состояние хранится только в памяти процесса.
+    Хранилище оборачивается в StatusCache.
+    """
+    if path and path.endswith(SQLITE_SUFFIXES):
+        return StatusCache(SqliteStateStore(path))
+    return StatusCache(JsonStateStore(path))
+
+
+class CircuitOpenError(Exception):
+    """Запрос не выполнен: автомат защиты сервиса разомкнут.
 
     Ключевые аргументы:
-    list_homework -- список домашних работ,
-    каждый элемент списка - это словарь с ключами:
-    id, status, approved, homework_name, reviewer_comment,
-    date_updated, lesson_name
+    name -- имя сервиса,
+    retry_after -- секунды до пробного запроса
     """
-    if response:
-        list_homework = response['homeworks']
-        if (isinstance(list_homework, list)):
-            return list_homework
-        else:
-            logging.error('Тип данных, полученного ответа,'
-                          'имеет некорректный тип.')
-            raise AttributeError
-    else:
-        logging.error('Ответ API содержит пустой словарь.')
-        raise ValueError
 
+    def __init__(self, name: str, retry_after: float):
+        """Создаёт исключение для сервиса name."""
+        super().__init__(f'{name} недоступен, повтор через '
+                         f'{retry_after:.0f} с.')
+        self.name = name
+        self.retry_after = retry_after
 
-def parse_status(home: List) -> str:
-    """Извлекает из информации о конкретной домашней работе статус этой работы.
-    Возвращает строку для отправки в Telegram чат
+
+class CircuitBreaker:
+    """Автомат защиты внешнего сервиса: closed -> open -> half-open.
+
+    После failure_threshold сбоев подряд автомат размыкается и
+    reset_timeout секунд не пропускает запросы; затем пропускает один
+    пробный запрос: успех замыкает автомат, сбой снова размыкает.
+
+    Ключевые аргументы:
+    name -- имя сервиса для логов,
+    failure_threshold -- число сбоев подряд до размыкания,
+    reset_timeout -- пауза перед пробным запросом в секундах
     """
-    homework_name = home['homework_name']
-    homework_status = home['status']
 
-    if homework_status in HOMEWORK_STATUSES:
-        if (
-            homework_status == 'approved'
-            or homework_status == 'reviewing'
-            or homework_status == 'rejected'
-        ):
-            verdict = HOMEWORK_STATUSES[homework_status]
-            return (f'{TEXTMESSAGE} "{homework_name}". {verdict}')
-    else:
-        logging.error('Недокументированный статус'
-                      'домашней работы в ответе API.')
-        raise KeyError
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
 
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURES,
+                 reset_timeout: float = BREAKER_RESET_TIME):
+        """Создаёт замкнутый автомат."""
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
 
-def check_tokens() -> bool:
-    """Проверяет доступность переменных окружения."""
-    try:
-        if PRACTICUM_TOKEN and TELEGRAM_TOKEN and TELEGRAM_CHAT_ID:
-            return True
-        else:
-            return False
-    except Exception:
-        logging.info('Отсутствуют необходимые переменные окружения.')
-        raise PermissionError
+    def acquire(self) -> float:
+        """Разрешает запрос (0) или возвращает, сколько секунд ждать."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            if self.state == self.HALF_OPEN:
+                return min(self.reset_timeout, 1.0)
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                return remaining
+            self.state = self.HALF_OPEN
+            logging.info(f'{self.name}: пробный запрос после сбоев.')
+            return 0.0
 
+    def record_success(self) -> None:
+        """Отмечает успешный запрос и замыкает автомат."""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logging.info(f'{self.name}: сервис снова доступен.')
+            self.state = self.CLOSED
+            self.failures = 0
 
-def main():
-    """Основная логика работы бота.
+    def record_failure(self) -> None:
+        """Отмечает сбой и при необходимости размыкает автомат."""
+        with self._lock:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN
+                    or self.failures >= self.failure_threshold):
+                if self.state != self.OPEN:
+                    logging.error(f'{self.name}: автомат разомкнут после '
+                                  f'{self.failures} сбоев подряд.')
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
 
-    1.Сделать запрос к API.
-    2.Проверить ответ.
-    3.Если есть обновления —
-    получить статус работы из обновления и отправить сообщение в Telegram.
-    4.Подождать некоторое время и сделать новый запрос.
 
+class ResponseCache:
+    """Валидаторы и хэши последних ответов API по подпискам.
+
+    Если сервер прислал ETag или Last-Modified, следующий запрос
+    становится условным (If-None-Match, If-Modified-Since) и ответ 304
+    считается неизменным. Иначе сравнивается SHA-1 тела ответа без
+    поля current_date, которое сервер меняет при каждом запросе.
+    Валидаторы и хэш нового ответа запоминаются только методом
+    commit() после того, как ответ полностью обработан: если обработка
+    прервалась, тот же ответ в следующий раз снова считается новым.
     """
-    bot = telegram.Bot(token=TELEGRAM_TOKEN)
-    check_variable = check_tokens()
-    now_datetime = datetime.datetime.now() - datetime.timedelta(30)
-    now = int(time.mktime(now_datetime.timetuple()))
 
-    while check_variable:
-        try:
-            resp = get_api_answer(now)
-            if len(resp['homeworks']) != 0:
-                check_answer = check_response(resp)
-                for i in check_answer:
-                    mess = parse_status(i)
-                    send_message(bot, TELEGRAM_CHAT_ID, mess)
-                    logging.info('Удачная отправка сообщения в Telegram.')
-                now = int(time.mktime(now_datetime.timetuple()))
-                time.sleep(RETRY_TIME)
-            else:
-                logging.info('Отсутствие в ответе новых статусов.')
-        except Exception as e:
-            message = f'Сбой в работе программы: {e}'
-            send_message(bot, TELEGRAM_CHAT_ID, message)
-            time.sleep(RETRY_TIME)
-            continue
-        else:
-            logging.info('Код выполнен без ошибок.')
+    CURRENT_DATE = re.compile(rb'"current_date"\s*:\s*(\d+)')
 
+    def __init__(self):
+        """Создаёт пустой кэш."""
+        self._entries: Dict[str, Tuple] = {}
+        self._pending: Dict[str, Tuple] = {}
+        self._lock = threading.Lock()
 
-if __name__ == '__main__':
-    main()
+    def request_headers(self, key: str) -> Dict[str, str]:
+        """Возвращает заголовки условного запроса для подписки key."""
+        with self._lock:
+            etag, modified, _ = self._entries.get(key, (None, None, None))
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if modified:
+            headers['If-Modified-Since'] = modified
+        return headers
+
+    def unchanged(self, key: str, response,
+                  hash_body: bool = True) -> Optional[Dict]:
+        """Проверяет, совпадает ли ответ с предыдущим.
+
+        Возвращает None для нового ответа, а для неизменного - словарь
+        с current_date, найденным в теле ответа (если оно есть).
+        При hash_body=False тело не читается (потоковый ответ),
+        запоминаются только валидаторы. Новый ответ ждёт commit(key).
+        """
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            return {}
+        headers = getattr(response, 'headers', None) or {}
+        body = getattr(response, 'content', None) if hash_body else None
+        digest = None
+        if isinstance(body, bytes):
+            digest = hashlib.sha1(self.CURRENT_DATE.sub(b'', body)).digest()
+        with self._lock:
+            previous = self._entries.get(key)
+            self._pending[key] = (
+                headers.get('ETag'), headers.get('Last-Modified'), digest
+            )
+        if digest is None or previous is None or previous[2] != digest:
+            return None
+        match = self.CURRENT_DATE.search(body)
+        return {'current_date': int(match.group(1))} if match else {}
+
+    def commit(self, key: str) -> None:
+        """Запоминает последний ответ подписки key как обработанный."""
+        with self._lock:
+            entry = self._pending.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+
+
+class PracticumClient:
+    """HTTP-клиент API Практикум.Домашка."""
+
+    def __init__(self, session=None, timeout: float = REQUEST_TIMEOUT,
+                 endpoint: str = ENDPOINT):
+        """Создаёт клиент.
+
+        Ключевые аргументы:
+        session -- объект с методом get() в интерфейсе requests:
+        requests.Session с пулом соединений; без него запросы идут
+        через сам модуль requests, импортируемый при первом запросе,
+        timeout -- таймаут одного запроса в секундах,
+        endpoint -- адрес API, по умолчанию ENDPOINT;
+        в атрибуте cache хранится ResponseCache условных запросов,
+        в атрибуте breaker - CircuitBreaker сервиса
+        """
+        self.session = session
+        self.timeout = timeout
+        self.endpoint = endpoint
+        self.cache = ResponseCache()
+        self.breaker = CircuitBreaker('API Практикума')
+
+    def get(self, headers: Dict[str, str], params: Dict,
+            stream: bool = False):
+        """Выполняет GET-запрос к API.
+
+        При stream=True тело ответа не загружается заранее и читается
+        через iter_content().
+        """
+        session = self.session
+        if session is None:
+            import requests as session
+        kwargs = {'stream': True} if stream else {}
+        return session.get(
+            self.endpoint, headers=headers, params=params,
+            timeout=self.timeout, **kwargs
+        )
+
+
+def make_bot(token: Optional[str]) -> Bot:
+    """Создаёт бота с пулом соединений на всех его пользователей.
+
+    Соединения нужны потокам SendQueue и, при BOT_COMMANDS=1,
+    long polling и обработчику команд.
+    """
+    import telegram
+    from telegram.utils.request import Request
+
+    return telegram.Bot(
+        token=token, request=Request(con_pool_size=SEND_WORKERS + 4)
+    )
+
+
+def make_session(pool_size: int = HTTP_POOL_SIZE) -> requests.Session:
+    """Создаёт сессию с keep-alive и пулом соединений к API.
+
+    Ключевые аргументы:
+    pool_size -- максимальное число соединений в пуле
+    """
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=pool_size, pool_block=True
+    )
+    session.mount('https://', adapter)
+    return session
+
+
+DEFAULT_CLIENT = PracticumClient()
+
+
+class HomeworkStatus(str, Enum):
+    """Документированные статусы домашней работы."""
+
+    APPROVED = 'approved'
+    REVIEWING = 'reviewing'
+    REJECTED = 'rejected'
+
+
+STATUS_BY_VALUE = {status.value: status for status in HomeworkStatus}
+
+
+class Homework:
+    """Домашняя работа из ответа API.
+
+    Запись строится один раз в check_response: статус переводится
+    в HomeworkStatus, а сообщение для Telegram форматируется заранее.
+    Недокументированный статус или отсутствие названия не мешают
+    построению записи - ошибку выбрасывает parse_status.
+
+    Ключевые аргументы:
+    id -- идентификатор работы (или название, если id нет),
+    name -- значение homework_name,
+    status -- значение status из ответа API,
+    kind -- статус в виде HomeworkStatus или None,
+    date_updated -- время последнего изменения статуса,
+    message -- сообщение для Telegram или None
+    """
+
+    __slots__ = ('id', 'name', 'status', 'kind', 'date_updated', 'message')
+
+    def __init__(self, id, name: Optional[str], status: Optional[str],
+                 date_updated: Optional[str] = None):
+        """Создаёт запись и заранее форматирует сообщение."""
+        self.id = id
+        self.name = name
+        self.status = status
+        self.kind = STATUS_BY_VALUE.get(status)
+        self.date_updated = date_updated
+        self.message = None
+        if self.kind is not None and name is not None:
+            verdict = HOMEWORK_STATUSES[status]
+            self.message = f'{TEXTMESSAGE} "{name}". {verdict}'
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Homework':
+        """Строит запись из словаря ответа API."""
+        name = data.get('homework_name')
+        return cls(data.get('id', name), name, data.get('status'),
+                   data.get('date_updated'))
+
+    def __repr__(self) -> str:
+        """Возвращает представление записи для отладки."""
+        return f'Homework({self.id!r}, {self.name!r}, {self.status!r})'
+
+
+class APIResponseError(ValueError):
+    """API вернуло код, отличный от 200.
+
+    Ключевые аргументы:
+    status_code -- HTTP-код ответа,
+    retry_after -- пауза из заголовка Retry-After в секундах или None
+    """
+
+    def __init__(self, status_code: int, retry_after: Optional[float]):
+        """Создаёт исключение по коду ответа и паузе Retry-After."""
+        super().__init__(f'API вернуло код {status_code}')
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Переводит заголовок Retry-After (секунды или HTTP-дата) в секунды."""
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = datetime.datetime.now(moment.tzinfo)
+    return max((moment - now).total_seconds(), 0.0)
+
+
+class TokenBucket:
+    """Ограничитель частоты «ведро токенов».
+
+    Ключевые аргументы:
+    rate -- число токенов, добавляемых в секунду,
+    capacity -- наибольшее число накопленных токенов
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """Создаёт заполненное ведро."""
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Возвращает, сколько секунд ждать до появления токена."""
+        self._refill(now)
+        return max((1 - self.tokens) / self.rate, 0.0)
+
+    def take(self, now: float) -> None:
+        """Расходует один токен."""
+        self._refill(now)
+        self.tokens -= 1
+
+
+class Outbox:
+    """Журнал исходящих сообщений в SQLite для доставки хотя бы раз.
+
+    Сообщение записывается в журнал до отправки и удаляется из него
+    после подтверждения Telegram, поэтому сообщения, не доставленные
+    из-за падения или недоступности Telegram, отправляются после
+    перезапуска. Сообщения, которые Telegram отклонил (BadRequest и
+    другие ошибки, не исправляемые повтором), переносятся в таблицу
+    dead_letters и повторно не отправляются. Соединение открывается
+    при первом обращении.
+
+    Шардированные процессы пишут в общий файл, помечая строки своим
+    номером shard; процесс шарда 0 забирает себе строки шардов,
+    исчезнувших после уменьшения их числа.
+
+    Ключевые аргументы:
+    path -- файл базы SQLite,
+    shard -- номер шарда процесса,
+    shards -- число шардов
+    """
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS outbox ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, shard INTEGER, '
+        'chat_id TEXT, text TEXT)',
+        'CREATE TABLE IF NOT EXISTS dead_letters ('
+        'id INTEGER PRIMARY KEY, shard INTEGER, chat_id TEXT, text TEXT)',
+    )
+
+    def __init__(self, path: str, shard: int = 0, shards: int = 1):
+        """Создаёт журнал, не открывая базу."""
+        self.path = path
+        self.shard = shard
+        self.shards = shards
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False
+            )
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.SCHEMA:
+                self._connection.execute(statement)
+            self._connection.commit()
+        return self._connection
+
+    def add(self, chat_id, text: str) -> int:
+        """Записывает сообщение в журнал и возвращает его номер."""
+        with self._lock:
+            connection = self._connect()
+            cursor = connection.execute(
+                'INSERT INTO outbox (shard, chat_id, text) VALUES (?, ?, ?)',
+                (self.shard, str(chat_id), text)
+            )
+            connection.commit()
+        return cursor.lastrowid
+
+    def ack(self, ids: List[int]) -> None:
+        """Удаляет доставленные сообщения из журнала."""
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                'DELETE FROM outbox WHERE id = ?', [(id_,) for id_ in ids]
+            )
+            connection.commit()
+
+    def reject(self, ids: List[int]) -> None:
+        """Переносит отклонённые Telegram сообщения в dead_letters."""
+        with self._lock:
+            connection = self._connect()
+            params = [(id_,) for id_ in ids]
+            connection.executemany(
+                'INSERT OR REPLACE INTO dead_letters '
+                'SELECT * FROM outbox WHERE id = ?', params
+            )
+            connection.executemany('DELETE FROM outbox WHERE id = ?', params)
+            connection.commit()
+
+    def dead_letters(self) -> List[Tuple[int, str, str]]:
+        """Возвращает отклонённые (номер, чат, текст) по порядку."""
+        with self._lock:
+            return self._connect().execute(
+                'SELECT id, chat_id, text FROM dead_letters ORDER BY id'
+            ).fetchall()
+
+    def pending(self) -> List[Tuple[int, str, str]]:
+        """Возвращает недоставленные (номер, чат, текст) по порядку."""
+        with self._lock:
+            connection = self._connect()
+            if self.shard == 0:
+                connection.execute(
+                    'UPDATE outbox SET shard = 0 WHERE shard >= ?',
+                    (self.shards,)
+                )
+                connection.commit()
+            return connection.execute(
+                'SELECT id, chat_id, text FROM outbox WHERE shard = ? '
+                'ORDER BY id', (self.shard,)
+            ).fetchall()
+
+
+class Delivery(Enum):
+    """Итог отправки сообщения очередью SendQueue."""
+
+    SENT = 'sent'
+    REJECTED = 'rejected'
+    FAILED = 'failed'
+
+
+def open_outbox(path: Optional[str]) -> Optional[Outbox]:
+    """Возвращает журнал отправки по пути из OUTBOX_FILE или None."""
+    return Outbox(path, SHARD_INDEX, SHARD_COUNT) if path else None
+
+
+class SendQueue:
+    """Очередь исходящих сообщений Telegram.
+
+    Повторяет интерфейс Bot.send_message, поэтому передаётся в
+    send_message() вместо бота. Пул фоновых потоков соблюдает общий
+    (TELEGRAM_GLOBAL_RATE) и початовый (TELEGRAM_CHAT_RATE) лимиты,
+    склеивает накопившиеся для одного чата строки в одно сообщение
+    и повторяет отправку при 429 и сетевых ошибках; при серии сетевых
+    сбоев, таймаутов и ответов 5xx автомат breaker приостанавливает
+    отправку. Отказ Telegram в конкретном сообщении (BadRequest) и 429
+    сбоем сервиса не считаются. Сообщения одного чата отправляются
+    по порядку, разные чаты - параллельно. Сообщение, не отправленное
+    после всех повторов, возвращается в начало очереди своего чата и
+    теряется, только если очередь остановлена stop() и его время на
+    отправку оставшихся сообщений вышло.
+    При maxsize ожидающих строк send_message() блокирует вызывающий
+    поток, пока очередь не освободится. С журналом outbox каждая строка
+    записывается в него до постановки в очередь и удаляется после
+    доставки, а start() первым делом ставит в очередь всё, что осталось
+    в журнале с прошлого запуска.
+    """
+
+    def __init__(self, bot: Bot, global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 chat_rate: float = TELEGRAM_CHAT_RATE,
+                 max_retries: int = TELEGRAM_MAX_RETRIES,
+                 workers: int = SEND_WORKERS,
+                 maxsize: int = SEND_QUEUE_SIZE,
+                 outbox: Optional[Outbox] = None):
+        """Создаёт очередь для бота bot, не запуская потоки."""
+        self.bot = bot
+        self.outbox = outbox
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.workers = workers
+        self.maxsize = maxsize
+        self._global = TokenBucket(global_rate)
+        self._chats: Dict[str, TokenBucket] = {}
+        self._pending: Dict[str, List[Tuple[str, List[int]]]] = (
+            OrderedDict()
+        )
+        self._busy = set()
+        self._size = 0
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._deadline: Optional[float] = None
+        self._threads = []
+        self.breaker = CircuitBreaker('Telegram')
+
+    def send_message(self, chat_id=None, text=None, **kwargs) -> None:
+        """Ставит сообщение в очередь чата chat_id.
+
+        Строка, уже ожидающая отправки в этот чат, повторно не ставится.
+        Журнал outbox пишется до захвата блокировки очереди, чтобы запись
+        на диск не задерживала потоки отправки и другие опросы.
+        """
+        outbox_id = None
+        if self.outbox is not None:
+            outbox_id = self.outbox.add(chat_id, text)
+        with self._condition:
+            while self.maxsize and self._size >= self.maxsize:
+                self._condition.wait()
+            self._put(chat_id, text, outbox_id)
+
+    def _put(self, chat_id, text: str, outbox_id: Optional[int]) -> None:
+        lines = self._pending.setdefault(chat_id, [])
+        ids = [] if outbox_id is None else [outbox_id]
+        for line, line_ids in lines:
+            if line == text:
+                line_ids.extend(ids)
+                return
+        lines.append((text, ids))
+        self._size += 1
+        self._condition.notify_all()
+
+    def start(self) -> SendQueue:
+        """Запускает пул потоков отправки."""
+        TELEGRAM_QUEUE_DEPTH.set_function(self.qsize)
+        if self.outbox is not None:
+            with self._condition:
+                for outbox_id, chat_id, text in self.outbox.pending():
+                    self._put(chat_id, text, outbox_id)
+                if self._size:
+                    logging.info(f'Из журнала отправки восстановлено '
+                                 f'сообщений: {self._size}.')
+        for number in range(self.workers):
+            thread = threading.Thread(
+                target=self.run, name=f'telegram-sender-{number}',
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Отправляет оставшиеся сообщения и останавливает потоки.
+
+        Ждёт не дольше timeout секунд в сумме; потоки отправки
+        фоновые и не мешают завершению процесса.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._stopped = True
+            self._deadline = deadline
+            self._condition.notify_all()
+        for thread in self._threads:
+            if deadline is None:
+                thread.join()
+            else:
+                thread.join(max(deadline - time.monotonic(), 0))
+        if self.qsize():
+            logging.error(f'Не отправлено сообщений: {self.qsize()}.')
+            if self.outbox is not None:
+                logging.info('Они будут отправлены после перезапуска.')
+
+    def qsize(self) -> int:
+        """Возвращает число строк, ожидающих отправки."""
+        with self._condition:
+            return self._size
+
+    def run(self) -> None:
+        """Цикл потока отправки: выбирает готовый чат и отправляет."""
+        while True:
+            with self._condition:
+                if not self._pending:
+                    if self._stopped:
+                        return
+                    self._condition.wait()
+                    continue
+                chat_id, wait = self._next_ready()
+                if chat_id is None:
+                    self._condition.wait(wait)
+                    continue
+                batch = self._take_batch(chat_id)
+                self._busy.add(chat_id)
+            ids = [id_ for _, line_ids in batch for id_ in line_ids]
+            delivery = Delivery.FAILED
+            try:
+                delivery = self._deliver(
+                    chat_id, '\n\n'.join(text for text, _ in batch)
+                )
+                if ids and delivery is Delivery.SENT:
+                    self.outbox.ack(ids)
+                elif ids and delivery is Delivery.REJECTED:
+                    self.outbox.reject(ids)
+            finally:
+                if delivery is Delivery.FAILED:
+                    self._requeue(chat_id, batch)
+                with self._condition:
+                    self._busy.discard(chat_id)
+                    self._condition.notify_all()
+
+    def _next_ready(self) -> Tuple[Optional[str], Optional[float]]:
+        now = time.monotonic()
+        global_wait = self._global.delay(now)
+        if global_wait > 0:
+            return None, global_wait
+        best_wait = None
+        for chat_id in self._pending:
+            if chat_id in self._busy:
+                continue
+            bucket = self._chats.get(chat_id)
+            if bucket is None:
+                bucket = self._chats[chat_id] = TokenBucket(self.chat_rate)
+            wait = bucket.delay(now)
+            if wait <= 0:
+                return chat_id, 0.0
+            best_wait = wait if best_wait is None else min(best_wait, wait)
+        return None, best_wait
+
+    def _requeue(self, chat_id,
+                 batch: List[Tuple[str, List[int]]]) -> None:
+        """Возвращает неотправленные строки в начало очереди чата.
+
+        После stop() строки возвращаются, только пока не истёк его
+        timeout, иначе отбрасываются: с журналом outbox они останутся
+        в нём до следующего запуска.
+        """
+        with self._condition:
+            if self._stopped and (self._deadline is None
+                                  or time.monotonic() >= self._deadline):
+                logging.error(f'Не отправлено сообщений: {len(batch)}.')
+                return
+            lines = self._pending.setdefault(chat_id, [])
+            self._pending.move_to_end(chat_id, last=False)
+            queued = {text: line_ids for text, line_ids in lines}
+            for text, line_ids in reversed(batch):
+                if text in queued:
+                    queued[text].extend(line_ids)
+                    continue
+                lines.insert(0, (text, line_ids))
+                self._size += 1
+            self._condition.notify_all()
+
+    def _take_batch(self, chat_id: str) -> List[Tuple[str, List[int]]]:
+        lines = self._pending[chat_id]
+        batch = [lines.pop(0)]
+        size = len(batch[0][0])
+        while lines and (
+            size + len(lines[0][0]) + 2 <= TELEGRAM_MESSAGE_LIMIT
+        ):
+            size += len(lines[0][0]) + 2
+            batch.append(lines.pop(0))
+        if not lines:
+            del self._pending[chat_id]
+        self._size -= len(batch)
+        self._condition.notify_all()
+        now = time.monotonic()
+        self._global.take(now)
+        self._chats[chat_id].take(now)
+        return batch
+
+    def _wait_for_breaker(self) -> None:
+        wait = self.breaker.acquire()
+        while wait:
+            time.sleep(wait)
+            wait = self.breaker.acquire()
+
+    def _deliver(self, chat_id: str, text: str) -> Delivery:
+        """Отправляет сообщение с повторами.
+
+        Возвращает FAILED, если все повторы исчерпаны и сообщение
+        нужно оставить в журнале, и REJECTED при ошибке, которую повтор
+        не исправит (в том числе BadRequest - подкласс NetworkError).
+        RetryAfter и BadRequest - ответы работающего Telegram, поэтому
+        они замыкают автомат защиты, в том числе после пробного запроса.
+        """
+        from telegram.error import BadRequest, NetworkError, RetryAfter
+
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_breaker()
+            try:
+                with TELEGRAM_LATENCY.time():
+                    self.bot.send_message(chat_id=chat_id, text=text)
+                self.breaker.record_success()
+                return Delivery.SENT
+            except RetryAfter as e:
+                TELEGRAM_FAILURES.inc(reason='retry_after')
+                self.breaker.record_success()
+                pause = e.retry_after
+            except BadRequest as e:
+                TELEGRAM_FAILURES.inc(reason='bad_request')
+                self.breaker.record_success()
+                logging.error(f'Telegram отклонил сообщение: {e}')
+                return Delivery.REJECTED
+            except NetworkError:
+                TELEGRAM_FAILURES.inc(reason='network')
+                self.breaker.record_failure()
+                pause = BACKOFF_FACTOR ** attempt
+            except Exception:
+                TELEGRAM_FAILURES.inc(reason='error')
+                self.breaker.record_success()
+                logging.error('Cбой при отправке сообщения в Telegram.')
+                return Delivery.REJECTED
+            if attempt < self.max_retries:
+                logging.warning(
+                    f'Повтор отправки в Telegram через {pause} с.'
+                )
+                time.sleep(pause)
+        logging.error('Сообщение в Telegram не отправлено '
+                      'после всех повторов.')
+        return Delivery.FAILED
+
+
+def send_message(bot: Bot, *args) -> Bot:
+    """Отправляет в Telegram чат сообщение.
+
+    Ключевые аргументы:
+    bot -- экземпляр класса Bot,
+    message -- текстовое сообщение - тип str
+    """
+    try:
+        arg_name = bot.send_message(chat_id=args[0], text=args[1])
+        return arg_name
+    except Exception:
+        TELEGRAM_FAILURES.inc(reason='error')
+        logging.error('Cбой при отправке сообщения в Telegram.')
+
+
+def get_api_answer(current_timestamp: int) -> Optional[Dict]:
+    """Возвращает ответ API.
+
+    Ключевые аргументы:
+    current_timestamp -- временная метка - текущее время,
+    params -- словарь параметров,
+    answer -- ответ, преобразованный из формата JSON к типам данных Python
+    """
+    return fetch_statuses(
+        {'Authorization': f'OAuth {PRACTICUM_TOKEN}'}, current_timestamp
+    )
+
+
+def fetch_statuses(headers: Dict[str, str], current_timestamp: int,
+                   client: Optional[PracticumClient] = None) -> Optional[Dict]:
+    """Запрашивает статусы домашних работ с произвольными заголовками.
+
+    Ключевые аргументы:
+    headers -- заголовки с токеном конкретной подписки,
+    current_timestamp -- временная метка начала выборки,
+    client -- HTTP-клиент, по умолчанию DEFAULT_CLIENT
+    """
+    homework_statuses = request_statuses(headers, current_timestamp, client)
+    answer = homework_statuses.json()
+    return answer
+
+
+BREAKER_STATUSES = (HTTPStatus.REQUEST_TIMEOUT, HTTPStatus.TOO_MANY_REQUESTS)
+
+
+def request_statuses(headers: Dict[str, str], current_timestamp: int,
+                     client: Optional[PracticumClient] = None,
+                     stream: bool = False):
+    """Выполняет запрос к API и проверяет код ответа.
+
+    Возвращает объект ответа requests; при коде, отличном от 200
+    и 304 (ответ на условный запрос), выбрасывает APIResponseError.
+    Ошибки сети, 5xx, 408 и 429 учитываются автоматом client.breaker;
+    пока он разомкнут, выбрасывается CircuitOpenError без запроса.
+    """
+    params = {'from_date': current_timestamp}
+    client = client or DEFAULT_CLIENT
+    wait = client.breaker.acquire()
+    if wait:
+        raise CircuitOpenError(client.breaker.name, wait)
+
+    with PRACTICUM_LATENCY.time():
+        try:
+            homework_statuses = client.get(headers, params, stream)
+        except Exception:
+            PRACTICUM_RESPONSES.inc(code='error')
+            client.breaker.record_failure()
+            raise
+    PRACTICUM_RESPONSES.inc(code=int(homework_statuses.status_code))
+    if homework_statuses.status_code in BREAKER_STATUSES or (
+        homework_statuses.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR
+    ):
+        client.breaker.record_failure()
+    else:
+        client.breaker.record_success()
+    if homework_statuses.status_code in (HTTPStatus.OK,
+                                         HTTPStatus.NOT_MODIFIED):
+        return homework_statuses
+    logging.error('API возвращает код, отличный от 200.')
+    headers = getattr(homework_statuses, 'headers', None) or {}
+    raise APIResponseError(
+        homework_statuses.status_code,
+        parse_retry_after(headers.get('Retry-After'))
+    )
+
+
+class JsonStream:
+    """Инкрементальный разбор JSON из потока байтовых фрагментов.
+
+    Значения читаются по одному через json.JSONDecoder.raw_decode,
+    в памяти хранится только ещё не разобранный остаток потока.
+    """
+
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, chunks: Iterable[bytes]):
+        """Создаёт разборщик над фрагментами chunks."""
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._exhausted = False
+
+    def _fill(self) -> bool:
+        if self._exhausted:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._exhausted = True
+            self._buffer = self._buffer[self._pos:] + self._text.decode(
+                b'', final=True
+            )
+        else:
+            self._buffer = self._buffer[self._pos:] + self._text.decode(
+                chunk
+            )
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Возвращает следующий значимый символ, не сдвигая позицию."""
+        while True:
+            self._pos = self.WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError('Ответ API оборвался.')
+
+    def accept(self, char: str) -> bool:
+        """Пропускает символ char, если он следующий."""
+        if self.peek() == char:
+            self._pos += 1
+            return True
+        return False
+
+    def expect(self, char: str) -> None:
+        """Пропускает символ char или выбрасывает ValueError."""
+        if self.peek() != char:
+            raise ValueError(f'Ожидался символ {char!r} в ответе API.')
+        self._pos += 1
+
+    def value(self):
+        """Разбирает и возвращает очередное JSON-значение."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(
+                    self._buffer, self._pos
+                )
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            if end < len(self._buffer) or not self._fill():
+                self._pos = end
+                return value
+
+
+def stream_homeworks(chunks: Iterable[bytes],
+                     meta: Dict) -> Iterator[Homework]:
+    """Поштучно выдаёт записи Homework из потока ответа API.
+
+    Остальные ключи верхнего уровня (current_date) записываются в meta
+    по мере разбора. После исчерпания генератора проверки совпадают
+    с check_response.
+
+    Ключевые аргументы:
+    chunks -- фрагменты тела ответа,
+    meta -- словарь для ключей ответа, кроме homeworks
+    """
+    stream = JsonStream(chunks)
+    stream.expect('{')
+    while stream.peek() != '}':
+        key = stream.value()
+        stream.expect(':')
+        if key == 'homeworks' and stream.peek() == '[':
+            meta['homeworks'] = []
+            for item in stream_array(stream):
+                yield Homework.from_dict(item)
+        else:
+            meta[key] = stream.value()
+        stream.accept(',')
+    check_response(meta)
+
+
+def stream_array(stream: JsonStream) -> Iterator:
+    """Поштучно выдаёт элементы JSON-массива."""
+    stream.expect('[')
+    count = 0
+    try:
+        while not stream.accept(']'):
+            count += 1
+            yield stream.value()
+            stream.accept(',')
+    finally:
+        HOMEWORKS_PARSED.inc(count)
+
+
+def fetch_statuses_stream(
+    headers: Dict[str, str], current_timestamp: int,
+    client: Optional[PracticumClient] = None
+) -> Tuple[Dict, Iterator[Homework]]:
+    """Потоковый вариант fetch_statuses.
+
+    Возвращает словарь meta и генератор домашних работ; current_date
+    появляется в meta по мере чтения ответа. Соединение закрывается,
+    когда генератор исчерпан или закрыт.
+    """
+    response = request_statuses(headers, current_timestamp, client, True)
+    return stream_response(response)
+
+
+def stream_response(response) -> Tuple[Dict, Iterator[Homework]]:
+    """Возвращает meta и генератор домашних работ по потоковому ответу."""
+    meta = {}
+
+    def homeworks() -> Iterator[Homework]:
+        try:
+            yield from stream_homeworks(
+                response.iter_content(STREAM_CHUNK_SIZE), meta
+            )
+        finally:
+            response.close()
+
+    return meta, homeworks()
+
+
+def check_response(response: Optional[Dict]):
+    """Функция возвращает список домашних работ.
+
+    Ключевые аргументы:
+    list_homework -- список домашних работ,
+    каждый элемент списка - это словарь с ключами:
+    id, status, approved, homework_name, reviewer_comment,
+    date_updated, lesson_name;
+    возвращаются записи Homework, построенные по этим словарям
+    """
+    if response:
+        list_homework = response['homeworks']
+        if (isinstance(list_homework, list)):
+            return [Homework.from_dict(item) for item in list_homework]
+        else:
+            logging.error('Тип данных, полученного ответа,'
+                          'имеет некорректный тип.')
+            raise AttributeError
+    else:
+        logging.error('Ответ API содержит пустой словарь.')
+        raise ValueError
+
+
+def parse_status(home: Union[Homework, Dict]) -> str:
+    """Извлекает из информации о конкретной домашней работе статус этой работы.
+    Возвращает строку для отправки в Telegram чат
+    """
+    if not isinstance(home, Homework):
+        home = Homework.from_dict(home)
+    if home.name is None:
+        logging.error('В ответе API нет названия домашней работы.')
+        raise KeyError('homework_name')
+    if home.message is None:
+        logging.error('Недокументированный статус'
+                      'домашней работы в ответе API.')
+        raise KeyError(home.status)
+    return home.message
+
+
+def missing_tokens() -> List[str]:
+    """Возвращает имена обязательных переменных окружения без значения.
+
+    При заданном TENANTS_FILE токен Практикума и чат берутся из реестра
+    подписок, и обязательным остаётся только токен бота.
+    """
+    required = {'TELEGRAM_TOKEN': TELEGRAM_TOKEN}
+    if not TENANTS_FILE:
+        required['PRACTICUM_TOKEN'] = PRACTICUM_TOKEN
+        required['TELEGRAM_CHAT_ID'] = TELEGRAM_CHAT_ID
+    return [name for name, value in required.items() if not value]
+
+
+def check_tokens() -> bool:
+    """Проверяет доступность переменных окружения."""
+    return not missing_tokens()
+
+
+def load_status_messages(path: Optional[str]) -> Dict[str, str]:
+    """Возвращает тексты статусов с переопределениями из JSON-файла path.
+
+    Файл - объект {"статус": "текст"}; статусы, которых нет в
+    HOMEWORK_STATUSES, вызывают ConfigError.
+    """
+    messages = dict(DEFAULT_HOMEWORK_STATUSES)
+    if path:
+        with open(path, encoding='utf-8') as file:
+            overrides = json.load(file)
+        unknown = set(overrides) - set(messages)
+        if unknown:
+            raise ConfigError(f'Неизвестные статусы в {path}: '
+                              + ', '.join(sorted(unknown)))
+        messages.update(overrides)
+    return messages
+
+
+def check_config() -> bool:
+    """Проверяет токены и настройки до создания бота.
+
+    Загружает тексты статусов из HOMEWORK_STATUSES_FILE. Каждая
+    найденная ошибка пишется в лог с уровнем CRITICAL.
+    """
+    problems = CONFIG.problems()
+    missing = missing_tokens()
+    if missing:
+        problems.insert(0, 'Отсутствуют необходимые переменные окружения: '
+                        + ', '.join(missing))
+    try:
+        HOMEWORK_STATUSES.update(load_status_messages(HOMEWORK_STATUSES_FILE))
+    except (OSError, ValueError) as e:
+        problems.append(f'HOMEWORK_STATUSES_FILE: {e}')
+    for problem in problems:
+        logging.critical(problem)
+    return not problems
+
+
+def is_new_status(store, tenant: Tenant, homework: Homework) -> bool:
+    """Проверяет, изменился ли статус работы с последней отправки."""
+    if store is None:
+        return True
+    last = store.get_status(tenant.key, homework.id)
+    return last != (homework.status, homework.date_updated)
+
+
+def collect_updates(resp: Optional[Dict], tenant: Optional[Tenant] = None,
+                    store=None) -> List[Tuple[Homework, str]]:
+    """Возвращает домашние работы из ответа API и сообщения о них.
+
+    Работы, статус которых уже был отправлен, пропускаются.
+
+    Ключевые аргументы:
+    resp -- ответ API, преобразованный к типам данных Python,
+    tenant -- подписка, для которой получен ответ,
+    store -- хранилище (кэш) последних статусов
+    """
+    if len(resp['homeworks']) == 0:
+        logging.info('Отсутствие в ответе новых статусов.')
+        return []
+    with PARSE_LATENCY.time():
+        homeworks = check_response(resp)
+        HOMEWORKS_PARSED.inc(len(homeworks))
+        return [
+            (i, parse_status(i)) for i in homeworks
+            if is_new_status(store, tenant, i)
+        ]
+
+
+def remember_status(store, tenant: Tenant, homework: Homework) -> None:
+    """Сохраняет отправленный статус домашней работы."""
+    if store is not None:
+        store.set_status(
+            tenant.key, homework.id, homework.status,
+            homework.date_updated
+        )
+
+
+def advance_cursor(tenant: Tenant, resp: Dict, store=None) -> None:
+    """Сдвигает временную метку подписки на current_date из ответа API.
+
+    Следующий запрос вернёт только изменения, произошедшие после
+    предыдущего; при отсутствии current_date метка не меняется.
+    Новая метка сохраняется в хранилище состояния, если оно передано.
+    """
+    current_date = resp.get('current_date')
+    if isinstance(current_date, int):
+        tenant.from_date = current_date
+        if store is not None:
+            store.set_cursor(tenant.key, current_date)
+
+
+def schedule_next(tenant: Tenant, updates: List[Tuple[Homework, str]],
+                  error: Optional[Exception] = None) -> None:
+    """Назначает подписке время следующего опроса.
+
+    Пустой ответ и сбой увеличивают интервал в BACKOFF_FACTOR раз
+    до MAX_RETRY_TIME, пока работа на проверке интервал не превышает
+    REVIEWING_RETRY_TIME. Интервал, заданный командой /interval,
+    заменяет вычисленный. Retry-After из ответа API соблюдается,
+    к интервалу добавляется случайный разброс ±JITTER.
+
+    Ключевые аргументы:
+    tenant -- подписка,
+    updates -- отправленные обновления (работа, сообщение),
+    error -- исключение, прервавшее опрос
+    """
+    statuses = [homework.kind for homework, _ in updates]
+    if statuses:
+        tenant.reviewing = statuses[-1] is HomeworkStatus.REVIEWING
+    if error is not None:
+        tenant.failures += 1
+        interval = RETRY_TIME * BACKOFF_FACTOR ** tenant.failures
+    else:
+        tenant.failures = 0
+        if HomeworkStatus.REVIEWING in statuses:
+            interval = RETRY_TIME
+        elif statuses:
+            interval = tenant.interval
+        else:
+            interval = tenant.interval * BACKOFF_FACTOR
+    interval = min(interval, MAX_RETRY_TIME)
+    if tenant.reviewing and error is None:
+        interval = min(interval, REVIEWING_RETRY_TIME)
+    if tenant.poll_interval and error is None:
+        interval = tenant.poll_interval
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after:
+        interval = max(interval, retry_after)
+    tenant.interval = interval
+    tenant.next_poll = time.monotonic() + interval * random.uniform(
+        1 - JITTER, 1 + JITTER
+    )
+
+
+def log_extra(tenant: Tenant, homework: Optional[Homework] = None,
+              latency: Optional[float] = None) -> Dict:
+    """Возвращает поля extra для структурированного лога.
+
+    Ключевые аргументы:
+    tenant -- подписка,
+    homework -- домашняя работа, о которой пишется запись,
+    latency -- время начала операции по time.perf_counter()
+    """
+    extra = {'tenant': tenant.name}
+    if homework is not None:
+        extra['homework_id'] = homework.id
+    if latency is not None:
+        extra['latency'] = round(time.perf_counter() - latency, 6)
+    return extra
+
+
+def iter_updates(homeworks: Iterable[Homework], tenant: Tenant,
+                 store=None) -> Iterator[Tuple[Homework, str]]:
+    """Поштучно выдаёт изменившиеся работы и сообщения о них."""
+    for homework in homeworks:
+        if is_new_status(store, tenant, homework):
+            yield homework, parse_status(homework)
+
+
+def fetch_updates(tenant: Tenant, client: Optional[PracticumClient] = None,
+                  store=None) -> Tuple[Dict, Iterable[Tuple[Homework, str]]]:
+    """Запрашивает API для подписки и возвращает ответ и обновления.
+
+    Запрос условный (client.cache): если ответ не изменился с прошлого
+    раза, check_response и parse_status не вызываются.
+    При STREAM_RESPONSES ответ разбирается потоково: обновления
+    выдаются по одной работе, а ответ (meta) заполняется по мере
+    чтения, поэтому память не растёт с размером истории.
+    """
+    client = client or DEFAULT_CLIENT
+    headers = {**tenant.headers, **client.cache.request_headers(tenant.key)}
+    response = request_statuses(
+        headers, tenant.from_date, client, STREAM_RESPONSES
+    )
+    if STREAM_RESPONSES:
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            response.close()
+            return {}, []
+        client.cache.unchanged(tenant.key, response, hash_body=False)
+        meta, homeworks = stream_response(response)
+        return meta, iter_updates(homeworks, tenant, store)
+    meta = client.cache.unchanged(tenant.key, response)
+    if meta is not None:
+        logging.info('Ответ API не изменился.')
+        return meta, []
+    resp = response.json()
+    return resp, collect_updates(resp, tenant, store)
+
+
+def error_alert(tenant: Tenant, error: Exception) -> Optional[str]:
+    """Возвращает сообщение о сбое, только если оно ещё не отправлялось.
+
+    Во время затяжного сбоя чат получает одно сообщение, а не новое
+    на каждом цикле опроса; сбой всё равно пишется в лог.
+    """
+    message = f'{ERRORMESSAGE}: {error}'
+    logging.error(message, extra=log_extra(tenant))
+    if tenant.alerted:
+        return None
+    tenant.alerted = True
+    return message
+
+
+def recovery_alert(tenant: Tenant) -> Optional[str]:
+    """Возвращает сообщение о восстановлении после отправленного сбоя."""
+    if not tenant.alerted:
+        return None
+    tenant.alerted = False
+    return RECOVERYMESSAGE
+
+
+def notify(bot: Bot, tenant: Tenant, message: Optional[str]) -> None:
+    """Отправляет сообщение в активные чаты подписки (None пропускается)."""
+    if message is None:
+        return
+    for chat_id in tenant.active_chat_ids:
+        send_message(bot, chat_id, message)
+
+
+def poll_tenant(bot: Bot, tenant: Tenant,
+                client: Optional[PracticumClient] = None,
+                store=None) -> None:
+    """Выполняет один цикл опроса API для подписки.
+
+    Ключевые аргументы:
+    bot -- экземпляр класса Bot, общий для всех подписок,
+    tenant -- подписка с токеном, чатом и временной меткой выборки,
+    client -- HTTP-клиент с пулом соединений,
+    store -- хранилище курсоров и статусов
+    """
+    if not tenant.active_chat_ids:
+        tenant.next_poll = time.monotonic() + tenant.interval
+        return
+    updates = []
+    started = time.perf_counter()
+    try:
+        resp, pending = fetch_updates(tenant, client, store)
+        for homework, mess in pending:
+            updates.append((homework, mess))
+            notify(bot, tenant, mess)
+            remember_status(store, tenant, homework)
+            logging.info('Удачная отправка сообщения в Telegram.',
+                         extra=log_extra(tenant, homework))
+        advance_cursor(tenant, resp, store)
+        (client or DEFAULT_CLIENT).cache.commit(tenant.key)
+    except Exception as e:
+        notify(bot, tenant, error_alert(tenant, e))
+        schedule_next(tenant, updates, e)
+    else:
+        logging.info('Код выполнен без ошибок.',
+                     extra=log_extra(tenant, latency=started))
+        notify(bot, tenant, recovery_alert(tenant))
+        schedule_next(tenant, updates)
+
+
+class BotCommands:
+    """Команды бота для чатов подписок.
+
+    /status - последние статусы работ и интервал опроса,
+    /pause и /resume - приостановить и возобновить уведомления в чат,
+    /interval N - опрашивать API раз в N секунд (без N - как раньше).
+    Ответы строятся по подпискам процесса и хранилищу состояния, без
+    запросов к API Практикума. Команда действует на подписки, уведомления
+    которых приходят в чат отправителя; подписка, все чаты которой
+    приостановлены, не опрашивается.
+
+    Ключевые аргументы:
+    tenants -- подписки процесса,
+    store -- хранилище курсоров и статусов
+    """
+
+    HELP = ('Команды: /status, /pause, /resume, /interval N '
+            f'(от {RETRY_TIME} до {MAX_RETRY_TIME} с).')
+
+    def __init__(self, tenants: List[Tenant], store):
+        """Создаёт обработчик команд для подписок tenants."""
+        self.tenants = tenants
+        self.store = store
+
+    def handle(self, chat_id, text: Optional[str]) -> str:
+        """Выполняет команду text из чата chat_id и возвращает ответ."""
+        chat_id = str(chat_id)
+        tenants = [tenant for tenant in self.tenants
+                   if chat_id in tenant.chat_ids]
+        if not tenants:
+            return 'Этот чат не подписан на статусы домашних работ.'
+        command, *args = (text or '/').split()
+        handler = {
+            'status': self.status,
+            'pause': self.pause,
+            'resume': self.resume,
+            'interval': self.interval,
+        }.get(command.lstrip('/').split('@')[0])
+        if handler is None:
+            return self.HELP
+        return handler(chat_id, tenants, args)
+
+    def status(self, chat_id: str, tenants: List[Tenant],
+               args: List[str]) -> str:
+        """Ответ на /status."""
+        lines = []
+        for tenant in tenants:
+            if len(tenants) > 1:
+                lines.append(f'{tenant.name}:')
+            records = self.store.get_statuses(tenant.key)
+            for homework_id, status, date_updated in records:
+                verdict = HOMEWORK_STATUSES.get(status, status)
+                lines.append(f'{date_updated or "-"}, работа {homework_id}: '
+                             f'{verdict}')
+            if not records:
+                lines.append('Изменений статусов пока не было.')
+            lines.append(f'Опрос раз в {tenant.interval:.0f} с.')
+            if chat_id in tenant.paused:
+                lines.append('Уведомления приостановлены.')
+        return '\n'.join(lines)
+
+    def pause(self, chat_id: str, tenants: List[Tenant],
+              args: List[str]) -> str:
+        """Ответ на /pause."""
+        for tenant in tenants:
+            if chat_id not in tenant.paused:
+                tenant.paused.append(chat_id)
+        return 'Уведомления приостановлены, /resume - возобновить.'
+
+    def resume(self, chat_id: str, tenants: List[Tenant],
+               args: List[str]) -> str:
+        """Ответ на /resume."""
+        for tenant in tenants:
+            if chat_id in tenant.paused:
+                tenant.paused.remove(chat_id)
+        return 'Уведомления возобновлены.'
+
+    def interval(self, chat_id: str, tenants: List[Tenant],
+                 args: List[str]) -> str:
+        """Ответ на /interval."""
+        if not args:
+            for tenant in tenants:
+                tenant.poll_interval = None
+            return 'Интервал опроса снова подбирается автоматически.'
+        try:
+            seconds = float(args[0])
+        except ValueError:
+            return self.HELP
+        if not RETRY_TIME <= seconds <= MAX_RETRY_TIME:
+            return self.HELP
+        for tenant in tenants:
+            tenant.poll_interval = seconds
+        return (f'Опрос раз в {seconds:.0f} с начиная со следующей '
+                'проверки.')
+
+
+def start_commands(bot: Bot, sender: SendQueue, tenants: List[Tenant],
+                   store) -> Optional[Updater]:
+    """Запускает приём команд бота, если задан BOT_COMMANDS=1.
+
+    Обновления Telegram читаются long polling в потоках Updater,
+    который использует тот же Bot и его пул соединений. Ответы
+    ставятся в очередь sender и подчиняются её лимитам. В
+    шардированном режиме команды не принимаются: getUpdates допускает
+    только одного читателя, а подписки разнесены по процессам.
+    Возвращает Updater (остановка - stop()) или None, если приём
+    команд выключен или Telegram недоступен при запуске.
+    """
+    if not BOT_COMMANDS:
+        return None
+    if SHARD_COUNT > 1:
+        logging.warning('Команды бота недоступны в шардированном режиме.')
+        return None
+    from telegram.error import TelegramError
+    from telegram.ext import Filters, MessageHandler, Updater
+
+    commands = BotCommands(tenants, store)
+
+    def reply(update, context):
+        chat_id = update.effective_chat.id
+        text = commands.handle(chat_id, update.effective_message.text)
+        send_message(sender, chat_id, text)
+
+    updater = Updater(bot=bot, workers=1)
+    updater.dispatcher.add_handler(MessageHandler(Filters.command, reply))
+    try:
+        updater.start_polling(drop_pending_updates=True)
+    except TelegramError as error:
+        logging.error(f'Не удалось запустить приём команд бота: {error}')
+        return None
+    logging.info('Приём команд бота запущен.')
+    return updater
+
+
+async def async_fetch_statuses(
+    headers: Dict[str, str], current_timestamp: int,
+    client: Optional[PracticumClient] = None
+) -> Optional[Dict]:
+    """Асинхронный вариант fetch_statuses.
+
+    Блокирующий запрос выполняется в пуле потоков цикла событий,
+    поэтому медленный ответ API не задерживает остальные подписки.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, fetch_statuses, headers, current_timestamp, client
+    )
+
+
+async def async_get_api_answer(current_timestamp: int) -> Optional[Dict]:
+    """Асинхронный вариант get_api_answer."""
+    return await async_fetch_statuses(
+        {'Authorization': f'OAuth {PRACTICUM_TOKEN}'}, current_timestamp
+    )
+
+
+async def async_send_message(bot: Bot, *args) -> Bot:
+    """Асинхронный вариант send_message."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, send_message, bot, *args)
+
+
+async def async_poll_tenant(
+    bot: Bot, tenant: Tenant, semaphore: asyncio.Semaphore,
+    client: Optional[PracticumClient] = None, store=None
+) -> None:
+    """Асинхронный цикл опроса подписки, ограниченный семафором.
+
+    Сам опрос - тот же poll_tenant(), выполняемый в пуле потоков цикла
+    событий, поэтому медленный ответ API или Telegram не задерживает
+    остальные подписки.
+
+    Ключевые аргументы:
+    bot -- экземпляр класса Bot, общий для всех подписок,
+    tenant -- подписка с токеном, чатом и временной меткой выборки,
+    semaphore -- ограничитель числа одновременных запросов,
+    client -- HTTP-клиент с пулом соединений,
+    store -- хранилище курсоров и статусов
+    """
+    loop = asyncio.get_running_loop()
+    async with semaphore:
+        await loop.run_in_executor(
+            None, poll_tenant, bot, tenant, client, store
+        )
+
+
+async def async_tenant_loop(
+    bot: Bot, tenant: Tenant, semaphore: asyncio.Semaphore,
+    client: Optional[PracticumClient] = None, store=None, delay: float = 0
+) -> None:
+    """Опрашивает подписку бесконечно, выдерживая её собственный интервал.
+
+    Первый опрос откладывается на delay секунд.
+    """
+    await asyncio.sleep(delay)
+    while True:
+        await async_poll_tenant(bot, tenant, semaphore, client, store)
+        await asyncio.sleep(max(tenant.next_poll - time.monotonic(), 0))
+
+
+async def async_flush_loop(store) -> None:
+    """Раз в RETRY_TIME секунд записывает состояние в пуле потоков.
+
+    Заодно снимает память для PROFILER, если трассировка включена.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(RETRY_TIME)
+        await loop.run_in_executor(None, store.flush)
+        PROFILER.snapshot()
+
+
+def prepare_tenants(store=None) -> List[Tenant]:
+    """Загружает подписки и выставляет начальную временную метку.
+
+    Метка берётся из хранилища состояния по Tenant.key (а для состояния,
+    записанного по имени подписки, - по имени), для новых подписок
+    отсчитывается на 30 дней назад.
+    """
+    now_datetime = datetime.datetime.now() - datetime.timedelta(30)
+    now = int(time.mktime(now_datetime.timetuple()))
+    tenants = get_tenants()
+    for tenant in tenants:
+        saved = None
+        if store is not None:
+            saved = (store.get_cursor(tenant.key)
+                     or store.get_cursor(tenant.name))
+        tenant.from_date = saved or now
+    logging.info(f'Загружено подписок: {len(tenants)}.')
+    return tenants
+
+
+class Profiler:
+    """Профилирование работающего бота по сигналу.
+
+    toggle_cpu() (SIGUSR1) запускает и останавливает выборочный
+    профилировщик: отдельный поток раз в interval секунд снимает стеки
+    всех потоков через sys._current_frames(), а при остановке пишет их
+    в формате свёрнутых стеков для flamegraph в файл
+    profile-<pid>-<время>.txt. В отличие от cProfile, он видит потоки
+    пулов опроса и отправки, уже запущенные к моменту сигнала.
+    toggle_memory() (SIGUSR2) включает tracemalloc; после этого
+    snapshot(), вызываемый раз в цикл записи состояния, пишет разницу
+    с предыдущим снимком в файл memory-<pid>-<время>.txt. Пока оба
+    режима выключены, нет ни потока, ни трассировки памяти, а snapshot()
+    сводится к одной проверке.
+
+    Ключевые аргументы:
+    directory -- каталог для файлов профиля,
+    interval -- период выборки стеков в секундах,
+    limit -- число строк в разнице снимков памяти
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR,
+                 interval: float = 0.01, limit: int = 50):
+        """Создаёт выключенный профилировщик."""
+        self.directory = directory
+        self.interval = interval
+        self.limit = limit
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._samples: Tally = Tally()
+        self._snapshot = None
+
+    def _path(self, kind: str) -> str:
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        return os.path.join(self.directory,
+                            f'{kind}-{os.getpid()}-{stamp}.txt')
+
+    def _sample(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} '
+                                 f'({os.path.basename(code.co_filename)})')
+                    frame = frame.f_back
+                self._samples[';'.join(reversed(stack))] += 1
+
+    def toggle_cpu(self, *args) -> Optional[str]:
+        """Запускает профилировщик или останавливает его и пишет профиль.
+
+        Возвращает путь к записанному файлу.
+        """
+        if self._sampler is None:
+            self._stop.clear()
+            self._samples = Tally()
+            self._sampler = threading.Thread(
+                target=self._sample, name='profiler', daemon=True
+            )
+            self._sampler.start()
+            logging.info('Профилирование запущено.')
+            return None
+        self._stop.set()
+        self._sampler.join()
+        self._sampler = None
+        path = self._path('profile')
+        with open(path, 'w', encoding='utf-8') as file:
+            for stack, count in self._samples.most_common():
+                file.write(f'{stack} {count}\n')
+        logging.info(f'Профиль записан в {path}.')
+        return path
+
+    def toggle_memory(self, *args) -> None:
+        """Включает или выключает трассировку памяти."""
+        import tracemalloc
+
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._snapshot = None
+            logging.info('Трассировка памяти выключена.')
+        else:
+            tracemalloc.start()
+            self._snapshot = tracemalloc.take_snapshot()
+            logging.info('Трассировка памяти включена.')
+
+    def snapshot(self) -> Optional[str]:
+        """Пишет разницу с предыдущим снимком памяти.
+
+        Ничего не делает, пока трассировка выключена. Возвращает путь
+        к записанному файлу.
+        """
+        if self._snapshot is None:
+            return None
+        import tracemalloc
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+        stats = snapshot.compare_to(self._snapshot, 'lineno')
+        self._snapshot = snapshot
+        path = self._path('memory')
+        with open(path, 'w', encoding='utf-8') as file:
+            for stat in stats[:self.limit]:
+                file.write(f'{stat}\n')
+        return path
+
+
+PROFILER = Profiler()
+
+
+def install_profiler_signals(add_handler: Callable = signal.signal) -> None:
+    """Назначает SIGUSR1 и SIGUSR2 переключателями PROFILER."""
+    add_handler(signal.SIGUSR1, PROFILER.toggle_cpu)
+    add_handler(signal.SIGUSR2, PROFILER.toggle_memory)
+
+
+RELOADABLE = ('practicum_token', 'telegram_chat_id', 'tenants_file',
+              'retry_time', 'max_retry_time', 'reviewing_retry_time',
+              'request_timeout', 'homework_statuses_file')
+
+
+def apply_config(config: Config) -> None:
+    """Применяет изменённые настройки из RELOADABLE к работающему боту.
+
+    Остальные изменения пишутся в лог и вступают в силу после
+    перезапуска процесса.
+    """
+    global CONFIG
+    applied = {}
+    for item in fields(Config):
+        value = getattr(config, item.name)
+        if value == getattr(CONFIG, item.name):
+            continue
+        if item.name in RELOADABLE:
+            applied[item.name] = value
+            globals()[item.name.upper()] = value
+            logging.info(f'Настройка {item.name.upper()} изменена.')
+        else:
+            logging.warning(f'Настройка {item.name.upper()} применится '
+                            'после перезапуска.')
+    CONFIG = replace(CONFIG, **applied)
+
+
+class Reloader:
+    """Перечитывает настройки и реестр подписок без перезапуска.
+
+    Перезагрузку запрашивает сигнал SIGHUP (request()) или изменение
+    файлов .env, TENANTS_FILE и HOMEWORK_STATUSES_FILE, которые
+    проверяются по времени изменения не чаще раза в RETRY_TIME секунд.
+    Как и при запуске, переменные окружения процесса важнее .env, а
+    значения, пришедшие из .env, перечитываются из него заново. Пул
+    соединений client, его кэш ответов и хранилище состояния
+    сохраняются, а подписки с прежним токеном остаются теми же
+    объектами со своими курсором и интервалом.
+
+    Ключевые аргументы:
+    store -- хранилище курсоров и статусов,
+    client -- HTTP-клиент API Практикума
+    """
+
+    def __init__(self, store, client: PracticumClient):
+        """Запоминает текущее время изменения файлов."""
+        from dotenv import find_dotenv
+
+        self.dotenv = find_dotenv()
+        self.store = store
+        self.client = client
+        self.requested = threading.Event()
+        self._mtimes = self._stat()
+        self._next_check = time.monotonic() + RETRY_TIME
+
+    def _stat(self) -> Dict[str, Optional[int]]:
+        mtimes = {}
+        for path in (self.dotenv, TENANTS_FILE, HOMEWORK_STATUSES_FILE):
+            if path:
+                try:
+                    mtimes[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    mtimes[path] = None
+        return mtimes
+
+    def request(self, *args) -> None:
+        """Запрашивает перезагрузку (обработчик SIGHUP)."""
+        self.requested.set()
+
+    def due(self) -> bool:
+        """Проверяет, пора ли перезагрузить настройки."""
+        if self.requested.is_set():
+            self.requested.clear()
+            return True
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + RETRY_TIME
+        mtimes = self._stat()
+        changed, self._mtimes = mtimes != self._mtimes, mtimes
+        return changed
+
+    def reload(self, tenants: List[Tenant]
+               ) -> Tuple[List[Tenant], List[Tenant]]:
+        """Применяет новые настройки и приводит tenants к новому реестру.
+
+        Список tenants меняется на месте. Возвращает добавленные и
+        удалённые подписки; при ошибке в настройках или реестре
+        ничего не меняет.
+        """
+        from dotenv import dotenv_values
+
+        try:
+            environ = {name: value for name, value in os.environ.items()
+                       if name not in DOTENV_KEYS}
+            config = Config.from_env({**dotenv_values(self.dotenv),
+                                      **environ})
+            problems = config.problems()
+            if problems:
+                raise ConfigError('; '.join(problems))
+            messages = load_status_messages(config.homework_statuses_file)
+        except (OSError, ValueError) as e:
+            logging.error(f'Настройки не перезагружены: {e}')
+            return [], []
+        previous = CONFIG
+        apply_config(config)
+        try:
+            fresh = prepare_tenants(self.store)
+        except Exception as e:
+            apply_config(previous)
+            logging.error(f'Реестр подписок не перезагружен: {e}')
+            return [], []
+        HOMEWORK_STATUSES.update(messages)
+        self.client.timeout = REQUEST_TIMEOUT
+        self._mtimes = self._stat()
+        return self._diff(tenants, fresh)
+
+    @staticmethod
+    def _diff(tenants: List[Tenant], fresh: List[Tenant]
+              ) -> Tuple[List[Tenant], List[Tenant]]:
+        current = {tenant.key: tenant for tenant in tenants}
+        keys = {tenant.key for tenant in fresh}
+        for tenant in fresh:
+            kept = current.get(tenant.key)
+            if kept is not None:
+                kept.name = tenant.name
+                kept.chat_id = tenant.chat_id
+                kept.followers = tenant.followers
+        added = [tenant for tenant in fresh if tenant.key not in current]
+        removed = [tenant for tenant in tenants if tenant.key not in keys]
+        tenants[:] = [current.get(tenant.key, tenant) for tenant in fresh]
+        logging.info(f'Подписки перезагружены: добавлено {len(added)}, '
+                     f'удалено {len(removed)}.')
+        return added, removed
+
+
+async def async_reload_loop(reloader: Reloader, tenants: List[Tenant],
+                            tasks: Dict[str, asyncio.Task],
+                            spawn: Callable[[Tenant], asyncio.Task]) -> None:
+    """Перезагружает настройки и запускает или отменяет задачи подписок.
+
+    Ключевые аргументы:
+    reloader -- объект перезагрузки,
+    tenants -- подписки,
+    tasks -- задачи опроса по Tenant.key,
+    spawn -- создаёт задачу опроса подписки
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(1)
+        if not reloader.due():
+            continue
+        added, removed = await loop.run_in_executor(
+            None, reloader.reload, tenants
+        )
+        for tenant in removed:
+            tasks.pop(tenant.key).cancel()
+        for tenant in added:
+            tasks[tenant.key] = spawn(tenant)
+
+
+async def async_main():
+    """Асинхронная логика работы бота.
+
+    Каждая подписка опрашивается в своей задаче со своим интервалом,
+    одновременно выполняется не более MAX_CONCURRENCY запросов.
+    Первые опросы разнесены во времени, как в Scheduler (start_step()).
+    По SIGHUP и при изменении файлов настроек задачи запускаются и
+    отменяются только для добавленных и удалённых подписок. По SIGTERM
+    и SIGINT задачи отменяются, начатые опросы дожидаются, а очередь
+    отправки и состояние сохраняются, как в main().
+    """
+    setup_logging()
+    if not check_config():
+        return
+    bot = make_bot(TELEGRAM_TOKEN)
+    store = open_state_store(STATE_FILE)
+    tenants = prepare_tenants(store)
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    client = PracticumClient(make_session(MAX_CONCURRENCY))
+    sender_bot = bot
+    if RECORD_FILE:
+        sender_bot = start_recording(RECORD_FILE, bot, client, tenants)
+    sender = SendQueue(sender_bot, outbox=open_outbox(OUTBOX_FILE)).start()
+    updater = start_commands(bot, sender, tenants, store)
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
+    reloader = Reloader(store, client)
+    loop.add_signal_handler(signal.SIGHUP, reloader.request)
+    install_profiler_signals(loop.add_signal_handler)
+
+    def spawn(tenant: Tenant, delay: float = 0) -> asyncio.Task:
+        return asyncio.create_task(
+            async_tenant_loop(sender, tenant, semaphore, client, store, delay)
+        )
+
+    step = start_step(len(tenants))
+    tasks = {tenant.key: spawn(tenant, index * step)
+             for index, tenant in enumerate(tenants)}
+    work = asyncio.gather(
+        async_flush_loop(store),
+        async_reload_loop(reloader, tenants, tasks, spawn),
+    )
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, work.cancel)
+
+    try:
+        await work
+    except asyncio.CancelledError:
+        logging.info('Получен сигнал остановки.')
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        await loop.shutdown_default_executor()
+        if updater is not None:
+            updater.stop()
+        sender.stop(SEND_DRAIN_TIMEOUT)
+        store.flush()
+        logging.info('Бот остановлен.')
+
+
+def start_step(count: int, start_rate: float = POLL_START_RATE) -> float:
+    """Возвращает шаг между первыми опросами count новых подписок.
+
+    Первые опросы идут не чаще start_rate в секунду, но все укладываются
+    в MAX_RETRY_TIME, чтобы запуск с большим реестром не ударил по API
+    Практикума одновременными запросами.
+    """
+    return min(1 / start_rate, MAX_RETRY_TIME / max(count, 1))
+
+
+class Scheduler:
+    """Очередь подписок по времени следующего опроса на двоичной куче.
+
+    Элементы кучи - (время опроса, порядковый номер, подписка); номер
+    различает подписки с одинаковым временем. Удалённая подписка не
+    ищется в куче, а пропускается при извлечении, поэтому add(),
+    push(), remove() и pop_due() стоят O(log n) на подписку, а время
+    ближайшего опроса next_due() - O(1). Подписка, отданная pop_due()
+    на опрос, возвращается в очередь через push() после schedule_next().
+
+    Ключевые аргументы:
+    start_rate -- сколько первых опросов в секунду делают новые подписки
+    """
+
+    def __init__(self, start_rate: float = POLL_START_RATE):
+        """Создаёт пустую очередь."""
+        self.start_rate = start_rate
+        self._heap: List[Tuple[float, int, Tenant]] = []
+        self._queued: Dict[int, int] = {}
+        self._members: Dict[int, Tenant] = {}
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        """Число подписок в очереди, не считая отданных на опрос."""
+        return len(self._queued)
+
+    def _push(self, tenant: Tenant, due: float) -> None:
+        seq = next(self._seq)
+        self._queued[id(tenant)] = seq
+        heapq.heappush(self._heap, (due, seq, tenant))
+
+    def add(self, tenants: Iterable[Tenant]) -> None:
+        """Ставит в очередь новые подписки, разнося их первые опросы."""
+        tenants = list(tenants)
+        now = time.monotonic()
+        step = start_step(len(tenants), self.start_rate)
+        for index, tenant in enumerate(tenants):
+            self._members[id(tenant)] = tenant
+            self._push(tenant, max(tenant.next_poll, now + index * step))
+
+    def push(self, tenant: Tenant) -> None:
+        """Возвращает опрошенную подписку в очередь к tenant.next_poll.
+
+        Подписки, удалённые remove() во время опроса, пропускаются.
+        """
+        if id(tenant) in self._members:
+            self._push(tenant, tenant.next_poll)
+
+    def remove(self, tenants: Iterable[Tenant]) -> None:
+        """Убирает подписки из очереди."""
+        for tenant in tenants:
+            self._members.pop(id(tenant), None)
+            self._queued.pop(id(tenant), None)
+
+    def next_due(self) -> Optional[float]:
+        """Возвращает время ближайшего опроса или None."""
+        heap = self._heap
+        while heap and self._queued.get(id(heap[0][2])) != heap[0][1]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def pop_due(self, now: float) -> Optional[Tenant]:
+        """Извлекает подписку, время опроса которой наступило к now."""
+        due = self.next_due()
+        if due is None or due > now:
+            return None
+        tenant = heapq.heappop(self._heap)[2]
+        del self._queued[id(tenant)]
+        return tenant
+
+
+def housekeeping(store, next_flush: float, scheduler: Scheduler,
+                 tenants: List[Tenant],
+                 reloader: Optional[Reloader] = None) -> float:
+    """Периодическая работа конвейера между опросами.
+
+    Записывает состояние и снимок памяти PROFILER, если наступил
+    next_flush, и перезагружает настройки, если это запрошено, ставя
+    добавленные подписки в scheduler и убирая из него удалённые.
+    Возвращает время следующей записи состояния.
+    """
+    if time.monotonic() >= next_flush:
+        store.flush()
+        PROFILER.snapshot()
+        next_flush = time.monotonic() + RETRY_TIME
+    if reloader is not None and reloader.due():
+        added, removed = reloader.reload(tenants)
+        scheduler.remove(removed)
+        scheduler.add(added)
+    return next_flush
+
+
+def run_pipeline(sender: SendQueue, tenants: List[Tenant],
+                 client: PracticumClient, store,
+                 stop_event: threading.Event,
+                 workers: int = POLL_WORKERS,
+                 reloader: Optional[Reloader] = None,
+                 start_rate: float = POLL_START_RATE) -> None:
+    """Конвейер опроса: пул опрашивающих потоков пишет в очередь отправки.
+
+    Подписки ждут опроса в Scheduler; те, время опроса которых
+    наступило, отдаются пулу из workers потоков, и одновременно в работе
+    не больше workers подписок. Цикл просыпается только к ближайшему
+    опросу, завершению опроса или записи состояния, поэтому его цена не
+    растёт с числом подписок. Найденные обновления попадают
+    в ограниченную очередь sender, которую разбирает собственный пул
+    потоков, поэтому задержки Практикума и Telegram не суммируются.
+    Состояние записывается не чаще раза в RETRY_TIME секунд, как
+    в async_flush_loop(). При stop_event дожидается текущих опросов.
+    С reloader список tenants меняется на месте при перезагрузке
+    реестра; удалённые подписки доопрашиваются, но больше
+    не назначаются.
+
+    Ключевые аргументы:
+    sender -- очередь отправки сообщений,
+    tenants -- подписки,
+    client -- HTTP-клиент с пулом соединений,
+    store -- хранилище курсоров и статусов,
+    stop_event -- событие остановки,
+    workers -- число опрашивающих потоков,
+    reloader -- перезагрузка настроек и подписок,
+    start_rate -- первых опросов в секунду при запуске (start_step())
+    """
+    scheduler = Scheduler(start_rate)
+    scheduler.add(tenants)
+    in_flight: Dict[Future, Tenant] = {}
+    next_flush = time.monotonic() + RETRY_TIME
+    with ThreadPoolExecutor(workers, thread_name_prefix='poller') as pool:
+        while not stop_event.is_set():
+            now = time.monotonic()
+            while len(in_flight) < workers:
+                tenant = scheduler.pop_due(now)
+                if tenant is None:
+                    break
+                future = pool.submit(poll_tenant, sender, tenant, client,
+                                     store)
+                in_flight[future] = tenant
+            timeout = max(next_flush - now, 0)
+            due = scheduler.next_due()
+            if due is not None and len(in_flight) < workers:
+                timeout = min(max(due - now, 0), timeout)
+            done = ()
+            if in_flight:
+                done = wait(in_flight, timeout, FIRST_COMPLETED).done
+            else:
+                stop_event.wait(timeout)
+            for future in done:
+                scheduler.push(in_flight.pop(future))
+            next_flush = housekeeping(store, next_flush, scheduler, tenants,
+                                      reloader)
+    store.flush()
+
+
+def main():
+    """Основная логика работы бота.
+
+    1.Загрузить подписки (TENANTS_FILE или переменные окружения).
+    2.Для каждой подписки сделать запрос к API и проверить ответ.
+    3.Если есть обновления —
+    получить статус работы из обновления и отправить сообщение
+    в чат подписки.
+    4.Назначить подписке следующий опрос (schedule_next) и ждать,
+    пока не наступит время ближайшего из них.
+
+    Опрос и отправка выполняются разными пулами потоков (run_pipeline).
+
+    """
+    setup_logging()
+    if not check_config():
+        return
+    bot = make_bot(TELEGRAM_TOKEN)
+    store = open_state_store(STATE_FILE)
+    tenants = prepare_tenants(store)
+    client = PracticumClient(make_session(max(HTTP_POOL_SIZE, POLL_WORKERS)))
+    sender_bot = bot
+    if RECORD_FILE:
+        sender_bot = start_recording(RECORD_FILE, bot, client, tenants)
+    sender = SendQueue(sender_bot, outbox=open_outbox(OUTBOX_FILE)).start()
+    updater = start_commands(bot, sender, tenants, store)
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    reloader = Reloader(store, client)
+    signal.signal(signal.SIGHUP, reloader.request)
+    install_profiler_signals()
+
+    try:
+        run_pipeline(sender, tenants, client, store, stop_event,
+                     reloader=reloader)
+    except KeyboardInterrupt:
+        logging.info('Получен сигнал остановки.')
+    finally:
+        if updater is not None:
+            updater.stop()
+        sender.stop(SEND_DRAIN_TIMEOUT)
+        store.flush()
+        logging.info('Бот остановлен.')
+
+
+RECORDED_HEADERS = ('ETag', 'Last-Modified', 'Retry-After')
+
+
+class Cassette:
+    """Кассета: запись трафика Практикума и Telegram в JSON Lines.
+
+    Строки кассеты - словари с полем type: 'tenant' (подписка и её
+    чаты), 'practicum' (ответ API) и 'telegram' (доставленное
+    сообщение). Вместо токенов Практикума пишутся их хэши token_key().
+    """
+
+    def __init__(self, path: str):
+        """Создаёт кассету, не открывая файл."""
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict) -> None:
+        """Дописывает запись в конец кассеты."""
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+
+    def read(self) -> Iterator[Dict]:
+        """Читает записи кассеты по порядку."""
+        with open(self.path, encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class RecordingSession:
+    """HTTP-сессия, записывающая ответы API Практикума в кассету.
+
+    Ключевые аргументы:
+    session -- исходная сессия или None для модуля requests,
+    cassette -- кассета для записи
+    """
+
+    def __init__(self, session, cassette: Cassette):
+        """Оборачивает session."""
+        self.session = session
+        self.cassette = cassette
+
+    def get(self, url: str, headers: Dict[str, str], params: Dict,
+            **kwargs):
+        """Выполняет запрос и записывает ответ или сетевую ошибку."""
+        session = self.session
+        if session is None:
+            import requests as session
+        record = {
+            'type': 'practicum',
+            'key': token_key(headers['Authorization'].partition(' ')[2]),
+            'from_date': params.get('from_date'),
+        }
+        try:
+            response = session.get(url, headers=headers, params=params,
+                                   **kwargs)
+        except Exception as e:
+            self.cassette.write({**record, 'error': str(e)})
+            raise
+        self.cassette.write({
+            **record,
+            'status': response.status_code,
+            'headers': {name: response.headers[name]
+                        for name in RECORDED_HEADERS
+                        if name in response.headers},
+            'body': response.content.decode('utf-8'),
+        })
+        return response
+
+
+class RecordingBot:
+    """Бот, записывающий доставленные сообщения в кассету."""
+
+    def __init__(self, bot: Bot, cassette: Cassette):
+        """Оборачивает bot."""
+        self.bot = bot
+        self.cassette = cassette
+
+    def send_message(self, chat_id=None, text=None, **kwargs):
+        """Отправляет сообщение и после успеха записывает его."""
+        result = self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+        self.cassette.write(
+            {'type': 'telegram', 'chat_id': str(chat_id), 'text': text}
+        )
+        return result
+
+
+def start_recording(path: str, bot: Bot, client: PracticumClient,
+                    tenants: List[Tenant]) -> RecordingBot:
+    """Включает запись трафика в кассету path (RECORD_FILE).
+
+    Записывает подписки, подменяет сессию client и возвращает бота,
+    которого нужно передать очереди отправки.
+    """
+    cassette = Cassette(path)
+    for tenant in tenants:
+        cassette.write({
+            'type': 'tenant', 'name': tenant.name,
+            'key': token_key(tenant.practicum_token),
+            'chat_ids': tenant.chat_ids,
+        })
+    client.session = RecordingSession(client.session, cassette)
+    logging.info(f'Трафик записывается в {path}.')
+    return RecordingBot(bot, cassette)
+
+
+class ReplaySession:
+    """HTTP-сессия, отвечающая записанными ответами API.
+
+    Ответы выдаются по очереди для каждого хэша токена; в роли токена
+    при воспроизведении выступает сам хэш, записанная сетевая ошибка
+    повторяется как requests.ConnectionError. Запросы, from_date которых
+    не совпал с записанным, считаются в атрибуте mismatches.
+
+    Ключевые аргументы:
+    records -- записи кассеты с type 'practicum'
+    """
+
+    def __init__(self, records: Iterable[Dict]):
+        """Раскладывает ответы по хэшам токенов."""
+        self._responses: Dict[str, deque] = {}
+        for record in records:
+            self._responses.setdefault(record['key'], deque()).append(record)
+        self.requests = 0
+        self.mismatches = 0
+
+    def remaining(self, key: str) -> int:
+        """Возвращает число невыданных ответов для хэша key."""
+        return len(self._responses.get(key, ()))
+
+    def peek(self, key: str) -> Dict:
+        """Возвращает следующий ответ для хэша key, не выдавая его."""
+        return self._responses[key][0]
+
+    def get(self, url: str, headers: Dict[str, str], params: Dict,
+            **kwargs):
+        """Возвращает следующий записанный ответ для токена."""
+        import requests
+        from requests.models import Response
+        from requests.structures import CaseInsensitiveDict
+
+        record = self._responses[
+            headers['Authorization'].partition(' ')[2]
+        ].popleft()
+        self.requests += 1
+        if params.get('from_date') != record['from_date']:
+            self.mismatches += 1
+        if 'error' in record:
+            raise requests.ConnectionError(record['error'])
+        response = Response()
+        response.url = url
+        response.status_code = record['status']
+        response.headers = CaseInsensitiveDict(record['headers'])
+        response.encoding = 'utf-8'
+        response._content = record['body'].encode('utf-8')
+        response._content_consumed = True
+        return response
+
+
+class ReplayBot:
+    """Бот, который запоминает сообщения вместо отправки."""
+
+    def __init__(self):
+        """Создаёт бота с пустым списком сообщений."""
+        self.sent: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id=None, text=None, **kwargs) -> None:
+        """Запоминает сообщение."""
+        with self._lock:
+            self.sent.append((str(chat_id), text))
+
+
+def message_lines(messages: Iterable[Tuple[str, str]]) -> Tally:
+    """Раскладывает склеенные SendQueue сообщения на строки по чатам."""
+    return Tally(
+        (chat_id, line)
+        for chat_id, text in messages for line in text.split('\n\n')
+    )
+
+
+def replay(path: str, workers: int = POLL_WORKERS) -> Dict:
+    """Прогоняет кассету path через опрос, разбор и отправку.
+
+    Интервалы опроса не соблюдаются: каждая подписка запрашивает
+    следующий записанный ответ сразу после предыдущего, а Telegram
+    заменяется ReplayBot. Поэтому подписки опрашиваются poll_tenant()
+    в пуле потоков напрямую, а не через run_pipeline(), который ждёт
+    назначенного времени опроса. Сообщения считаются по строкам
+    (message_lines), так как SendQueue склеивает строки одного чата.
+    Возвращает число запросов и строк сообщений,
+    время, запросы с неожиданным from_date и расхождения отправленных
+    строк с записанными (missing - не отправлены, unexpected - лишние).
+    """
+    records = list(Cassette(path).read())
+    session = ReplaySession(
+        record for record in records if record['type'] == 'practicum'
+    )
+    client = PracticumClient(session)
+    client.breaker = CircuitBreaker('replay', failure_threshold=sys.maxsize)
+    bot = ReplayBot()
+    sender = SendQueue(bot, global_rate=1e9, chat_rate=1e9,
+                       maxsize=0).start()
+    store = open_state_store(None)
+    tenants = []
+    for record in records:
+        if record['type'] == 'tenant' and session.remaining(record['key']):
+            first = session.peek(record['key'])
+            chat_id, *followers = record['chat_ids']
+            tenants.append(Tenant(record['name'], record['key'], chat_id,
+                                  first['from_date'] or 0,
+                                  followers=followers))
+
+    def play(tenant: Tenant) -> None:
+        while session.remaining(tenant.practicum_token):
+            poll_tenant(sender, tenant, client, store)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers, thread_name_prefix='replay') as pool:
+        list(pool.map(play, tenants))
+    sender.stop()
+    elapsed = time.perf_counter() - started
+    expected = message_lines(
+        (record['chat_id'], record['text'])
+        for record in records if record['type'] == 'telegram'
+    )
+    sent = message_lines(bot.sent)
+    return {
+        'requests': session.requests,
+        'messages': sum(sent.values()),
+        'elapsed': elapsed,
+        'requests_s': session.requests / elapsed if elapsed else 0.0,
+        'from_date_mismatches': session.mismatches,
+        'missing': sum((expected - sent).values()),
+        'unexpected': sum((sent - expected).values()),
+    }
+
+
+class Supervisor:
+    """Запускает шардированные рабочие процессы и следит за ними.
+
+    Каждый процесс - это `python homework.py` с переменными SHARD_INDEX
+    и SHARD_COUNT, а также собственными LOG_FILE, METRICS_PORT и (для
+    JSON) STATE_FILE. Упавший процесс перезапускается с паузой, которая
+    растёт при частых падениях. SIGTTIN и SIGTTOU добавляют и убирают
+    процесс; после этого все процессы перезапускаются с новым
+    SHARD_COUNT, а HashRing переносит между ними лишь часть подписок.
+
+    Ключевые аргументы:
+    workers -- начальное число рабочих процессов
+    """
+
+    def __init__(self, workers: int):
+        """Создаёт супервизор, не запуская процессы."""
+        self.workers = max(workers, 1)
+        self.processes: Dict[int, subprocess.Popen] = {}
+        self.started: Dict[int, float] = {}
+        self.crashes: Dict[int, int] = {}
+        self.pending_resize = 0
+        self.stopping = False
+
+    def worker_env(self, index: int) -> Dict[str, str]:
+        """Возвращает окружение рабочего процесса index."""
+        env = dict(os.environ, SHARD_INDEX=str(index),
+                   SHARD_COUNT=str(self.workers),
+                   LOG_FILE=f'{LOG_FILE}.{index}')
+        if METRICS_PORT:
+            env['METRICS_PORT'] = str(int(METRICS_PORT) + 1 + index)
+        if STATE_FILE and not STATE_FILE.endswith(SQLITE_SUFFIXES):
+            env['STATE_FILE'] = f'{STATE_FILE}.{index}'
+        return env
+
+    def start_worker(self, index: int) -> None:
+        """Запускает рабочий процесс index."""
+        self.processes[index] = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            env=self.worker_env(index)
+        )
+        self.started[index] = time.monotonic()
+        logging.info(f'Запущен процесс шарда {index} из {self.workers}.')
+
+    def stop_workers(self) -> None:
+        """Останавливает все процессы и ждёт отправки их очередей."""
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            process.wait()
+        self.processes.clear()
+
+    def resize(self) -> None:
+        """Применяет запрошенное сигналами изменение числа процессов."""
+        workers = max(self.workers + self.pending_resize, 1)
+        self.pending_resize = 0
+        if workers == self.workers:
+            return
+        logging.info(f'Число процессов: {self.workers} -> {workers}.')
+        self.stop_workers()
+        self.workers = workers
+        self.crashes.clear()
+        for index in range(workers):
+            self.start_worker(index)
+
+    def restart_delay(self, index: int) -> float:
+        """Возвращает паузу перед перезапуском упавшего процесса.
+
+        Пауза удваивается с каждым падением подряд до MAX_RETRY_TIME;
+        процесс, проработавший дольше MAX_RETRY_TIME, сбрасывает счётчик.
+        """
+        if time.monotonic() - self.started[index] > MAX_RETRY_TIME:
+            self.crashes[index] = 0
+        crashes = self.crashes.get(index, 0)
+        return min(RETRY_TIME * BACKOFF_FACTOR ** crashes, MAX_RETRY_TIME)
+
+    def check_workers(self) -> None:
+        """Перезапускает завершившиеся процессы после паузы."""
+        now = time.monotonic()
+        for index, process in list(self.processes.items()):
+            if process.poll() is None:
+                continue
+            if index not in self.crashes or now >= self.started[index] + (
+                self.restart_delay(index)
+            ):
+                logging.error(f'Процесс шарда {index} завершился с кодом '
+                              f'{process.returncode}, перезапуск.')
+                self.crashes[index] = self.crashes.get(index, 0) + 1
+                self.start_worker(index)
+
+    def run(self) -> None:
+        """Основной цикл супервизора."""
+        if STATE_FILE and not STATE_FILE.endswith(SQLITE_SUFFIXES):
+            logging.warning('JSON-состояние хранится по шардам и теряется '
+                            'при перераспределении; используйте SQLite.')
+        signal.signal(signal.SIGTTIN, lambda *args: self.request_resize(1))
+        signal.signal(signal.SIGTTOU, lambda *args: self.request_resize(-1))
+        signal.signal(signal.SIGTERM, lambda *args: self.stop())
+        for signum in (signal.SIGHUP, signal.SIGUSR1, signal.SIGUSR2):
+            signal.signal(signum, lambda signum, frame: self.broadcast(
+                signum
+            ))
+        for index in range(self.workers):
+            self.start_worker(index)
+        try:
+            while not self.stopping:
+                if self.pending_resize:
+                    self.resize()
+                self.check_workers()
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop_workers()
+
+    def broadcast(self, signum: int) -> None:
+        """Пересылает сигнал signum всем рабочим процессам."""
+        for process in self.processes.values():
+            process.send_signal(signum)
+
+    def request_resize(self, delta: int) -> None:
+        """Запоминает запрос на изменение числа процессов."""
+        self.pending_resize += delta
+
+    def stop(self) -> None:
+        """Просит основной цикл завершиться."""
+        self.stopping = True
+
+
+def supervise(workers: int) -> None:
+    """Точка входа шардированного режима."""
+    setup_logging(f'{LOG_FILE}.supervisor')
+    if not check_config():
+        return
+    Supervisor(workers).run()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(description='Бот статусов Практикума.')
+    parser.add_argument('--supervisor', action='store_true',
+                        help='запустить шардированные рабочие процессы')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='число рабочих процессов супервизора')
+    parser.add_argument('--replay', metavar='CASSETTE',
+                        help='прогнать записанную кассету и выйти')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.replay:
+        report = replay(args.replay)
+        print(json.dumps(report, ensure_ascii=False))
+        sys.exit(1 if report['missing'] or report['unexpected'] else 0)
+    elif args.supervisor:
+        supervise(args.workers)
+    elif BOT_ENGINE == 'async':
+        asyncio.run(async_main())
+    else:
+        main()
@@ -0,0 +1,296 @@
+"""Замеры горячего пути опрос -> разбор -> отправка.
+
+Запуск из корня проекта:
+
+    python tests/benchmark.py
+    python tests/benchmark.py --tenants 1 100 10000 --homeworks 10
+    python tests/benchmark.py --http
+
+По умолчанию запросы к API подменяются MockResponseGET, а бот -
+MockTelegramBot из tests/test_bot.py. С ключом --http поднимается
+локальный HTTP-сервер, имитирующий API Практикума и Telegram Bot API,
+и запросы идут через настоящие requests.Session и telegram.Bot.
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import telegram
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test_bot import MockResponseGET, MockTelegramBot  # noqa: E402
+
+import homework  # noqa: E402
+
+STATUSES = list(homework.HOMEWORK_STATUSES)
+
+
+def make_payload(homeworks: int, current_date: int) -> dict:
+    """Ответ API с заданным числом домашних работ."""
+    return {
+        'homeworks': [
+            {
+                'id': i,
+                'status': STATUSES[i % len(STATUSES)],
+                'homework_name': f'student__hw{i:05d}.zip',
+                'reviewer_comment': 'Всё нравится',
+                'date_updated': '2020-02-13T14:40:57Z',
+                'lesson_name': 'Итоговый проект',
+            }
+            for i in range(homeworks)
+        ],
+        'current_date': current_date,
+    }
+
+
+def patch_requests_get(payload: dict) -> None:
+    """Подменяет requests.get ответом MockResponseGET с payload."""
+    def mock_response_get(*args, **kwargs):
+        response = MockResponseGET(
+            *args, random_timestamp=payload['current_date'],
+            current_timestamp=kwargs['params']['from_date'], **kwargs
+        )
+        response.json = lambda: payload
+        return response
+
+    requests.get = mock_response_get
+
+
+class FakeServer(BaseHTTPRequestHandler):
+    """Имитация API Практикума (GET) и Telegram Bot API (POST)."""
+
+    payload = b''
+    telegram_reply = json.dumps({
+        'ok': True,
+        'result': {
+            'message_id': 1, 'date': 0,
+            'chat': {'id': 1, 'type': 'private'},
+        },
+    }).encode()
+
+    def _reply(self, body: bytes) -> None:
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(self.payload)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply(self.telegram_reply)
+
+    def log_message(self, *args):
+        pass
+
+
+class CountingBot:
+    """Обёртка над ботом, считающая успешные вызовы send_message."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def send_message(self, *args, **kwargs):
+        result = self.bot.send_message(*args, **kwargs)
+        with self._lock:
+            self.sent += 1
+        return result
+
+
+def start_server(payload: dict) -> ThreadingHTTPServer:
+    """Запускает FakeServer на свободном порту в фоновом потоке."""
+    FakeServer.payload = json.dumps(payload).encode()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeServer)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_cycle(tenants, client, bot) -> dict:
+    """Один цикл конвейера по всем подпискам с замером ресурсов."""
+    sender = homework.SendQueue(
+        bot, global_rate=1e9, chat_rate=1e9, maxsize=0
+    ).start()
+    store = homework.open_state_store(None)
+    stop_event = threading.Event()
+    for tenant in tenants:
+        tenant.next_poll = 0.0
+
+    def stop_when_polled():
+        while any(tenant.next_poll == 0.0 for tenant in tenants):
+            time.sleep(0.001)
+        stop_event.set()
+
+    watcher = threading.Thread(target=stop_when_polled)
+    sent = bot.sent
+    started, cpu_started = time.perf_counter(), time.process_time()
+    watcher.start()
+    homework.run_pipeline(sender, tenants, client, store, stop_event,
+                          start_rate=math.inf)
+    sender.stop()
+    watcher.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'elapsed': elapsed,
+        'cpu': time.process_time() - cpu_started,
+        'messages': bot.sent - sent,
+    }
+
+
+def bench_tenants(count: int, homeworks: int, cycles: int,
+                  http: bool) -> dict:
+    """Замер конвейера для count подписок по homeworks работ."""
+    now = int(time.time())
+    payload = make_payload(homeworks, now)
+    tenants = [
+        homework.Tenant(str(i), f'token{i}', str(i), now)
+        for i in range(count)
+    ]
+    if http:
+        server = start_server(payload)
+        base = f'http://127.0.0.1:{server.server_port}'
+        client = homework.PracticumClient(
+            homework.make_session(homework.POLL_WORKERS),
+            endpoint=f'{base}/api/user_api/homework_statuses/'
+        )
+        bot = telegram.Bot('1234:abcdefg', base_url=f'{base}/bot')
+    else:
+        patch_requests_get(payload)
+        client = homework.DEFAULT_CLIENT
+        bot = MockTelegramBot(token='1234:abcdefg')
+    bot = CountingBot(bot)
+    results = [run_cycle(tenants, client, bot) for _ in range(cycles)]
+    if http:
+        server.shutdown()
+    best = min(results, key=lambda result: result['elapsed'])
+    return {
+        'tenants': count,
+        'homeworks': homeworks,
+        'cycle_ms': best['elapsed'] * 1000,
+        'cpu_ms': best['cpu'] * 1000,
+        'messages_s': best['messages'] / best['elapsed'],
+    }
+
+
+def bench_large_payload(homeworks: int, cycles: int) -> dict:
+    """Замер разбора одного большого ответа API."""
+    payload = make_payload(homeworks, int(time.time()))
+    body = json.dumps(payload)
+    timings = []
+    for _ in range(cycles):
+        started = time.perf_counter()
+        updates = homework.collect_updates(json.loads(body))
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {
+        'homeworks': homeworks,
+        'parse_ms': best * 1000,
+        'homeworks_s': len(updates) / best,
+    }
+
+
+def bench_scheduler(count: int) -> dict:
+    """Замер очереди Scheduler: постановка и извлечение count подписок."""
+    tenants = [homework.Tenant(str(i), f'token{i}', str(i))
+               for i in range(count)]
+    scheduler = homework.Scheduler(start_rate=math.inf)
+    started = time.perf_counter()
+    scheduler.add(tenants)
+    for tenant in tenants:
+        tenant.next_poll = scheduler.next_due() + count
+        scheduler.push(scheduler.pop_due(math.inf))
+    elapsed = time.perf_counter() - started
+    return {'tenants': count, 'op_us': elapsed / (3 * count) * 1e6}
+
+
+def max_rss_mb() -> float:
+    """Пиковый размер резидентной памяти процесса в мегабайтах."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_isolated(args, kind: str, size: int) -> dict:
+    """Запускает один замер в отдельном процессе.
+
+    Пиковая память процесса только растёт, поэтому в общем процессе
+    каждая строка после самого большого замера повторяла бы его пик.
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--one', kind,
+               str(size), '--homeworks', str(args.homeworks),
+               '--cycles', str(args.cycles)]
+    if args.http:
+        command.append('--http')
+    output = subprocess.run(command, check=True, capture_output=True,
+                            text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def run_one(args) -> dict:
+    """Выполняет замер --one в текущем процессе."""
+    kind, size = args.one[0], int(args.one[1])
+    if kind == 'tenants':
+        result = bench_tenants(size, args.homeworks, args.cycles, args.http)
+    else:
+        result = bench_large_payload(size, args.cycles)
+    result['max_rss_mb'] = max_rss_mb()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tenants', type=int, nargs='+',
+                        default=[1, 100, 10000])
+    parser.add_argument('--homeworks', type=int, default=3,
+                        help='работ в ответе API на одну подписку')
+    parser.add_argument('--large', type=int, nargs='+',
+                        default=[1000, 100000],
+                        help='размеры ответа для замера разбора')
+    parser.add_argument('--scheduler', type=int, nargs='+',
+                        default=[10000, 100000],
+                        help='размеры очереди для замера Scheduler')
+    parser.add_argument('--cycles', type=int, default=3)
+    parser.add_argument('--http', action='store_true',
+                        help='ходить в локальный HTTP-сервер вместо моков')
+    parser.add_argument('--one', nargs=2, metavar=('KIND', 'SIZE'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.one:
+        print(json.dumps(run_one(args)))
+        return
+
+    print('tenants  homeworks  cycle_ms    cpu_ms  messages/s  max_rss_mb')
+    for count in args.tenants:
+        result = run_isolated(args, 'tenants', count)
+        print(f"{result['tenants']:7d}  {result['homeworks']:9d}  "
+              f"{result['cycle_ms']:8.1f}  {result['cpu_ms']:8.1f}  "
+              f"{result['messages_s']:10.0f}  {result['max_rss_mb']:10.1f}")
+
+    print()
+    print('homeworks  parse_ms  homeworks/s  max_rss_mb')
+    for size in args.large:
+        result = run_isolated(args, 'large', size)
+        print(f"{result['homeworks']:9d}  {result['parse_ms']:8.1f}  "
+              f"{result['homeworks_s']:11.0f}  {result['max_rss_mb']:10.1f}")
+
+    print()
+    print('scheduler_tenants  op_us')
+    for count in args.scheduler:
+        result = bench_scheduler(count)
+        print(f"{result['tenants']:17d}  {result['op_us']:5.2f}")
+
+
+if __name__ == '__main__':
+    main()
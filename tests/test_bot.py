@@ -1,3 +1,4 @@
+import json
 import os
 from http import HTTPStatus
 
@@ -150,6 +151,31 @@ class TestHomework:
             f'функция {func_name} возвращает True'
         )
 
+    def test_config_from_env(self):
+        import homework
+
+        config = homework.Config.from_env({
+            'RETRY_TIME': '30', 'STREAM_RESPONSES': 'true', 'STATE_FILE': '',
+        })
+        assert (config.retry_time, config.stream_responses,
+                config.state_file) == (30, True, None), (
+            'Проверьте, что настройки приводятся к типам полей Config'
+        )
+        try:
+            homework.Config.from_env({'POLL_WORKERS': 'four',
+                                      'BOT_ENGINE': 'gevent'})
+        except homework.ConfigError as e:
+            assert 'POLL_WORKERS' in str(e) and 'BOT_ENGINE' in str(e), (
+                'Проверьте, что ConfigError перечисляет все неверные '
+                'переменные окружения'
+            )
+        else:
+            assert False, 'Проверьте, что неверные настройки вызывают ошибку'
+        assert homework.Config(shard_index=2, shard_count=2).problems(), (
+            'Проверьте, что несогласованные настройки обнаруживаются '
+            'до запуска бота'
+        )
+
     def test_bot_init_not_global(self):
         import homework
 
@@ -640,3 +666,834 @@ class TestHomework:
                 f'Убедитесь, что в функции `{func_name}` обрабатываете ситуацию, '
                 'когда API возвращает код, отличный от 200'
             )
+
+    def test_load_tenants_json(self, tmp_path):
+        import homework
+
+        path = tmp_path / 'tenants.json'
+        path.write_text(
+            '[{"name": "student", "practicum_token": "tok", "chat_id": 1}]',
+            encoding='utf-8'
+        )
+        tenants = homework.load_tenants(str(path))
+        assert len(tenants) == 1, (
+            'Проверьте, что функция `load_tenants` читает все подписки'
+        )
+        assert tenants[0].chat_id == '1'
+        assert tenants[0].headers == {'Authorization': 'OAuth tok'}
+
+    def test_async_poll_tenant(self, monkeypatch, random_timestamp,
+                               current_timestamp):
+        def mock_response_get(*args, **kwargs):
+            response = MockResponseGET(
+                *args, random_timestamp=random_timestamp,
+                current_timestamp=current_timestamp, **kwargs
+            )
+            response.json = lambda: {
+                'homeworks': [{'homework_name': 'hw1', 'status': 'approved'}],
+                'current_date': random_timestamp
+            }
+            return response
+
+        monkeypatch.setattr(requests, 'get', mock_response_get)
+
+        import asyncio
+        import homework
+
+        sent = []
+        bot = MockTelegramBot(token='1234:abcdefg')
+        monkeypatch.setattr(
+            bot, 'send_message',
+            lambda chat_id=None, text=None: sent.append((chat_id, text))
+        )
+        tenant = homework.Tenant('t', 'tok', '42', current_timestamp)
+        asyncio.run(
+            homework.async_poll_tenant(bot, tenant, asyncio.Semaphore(1))
+        )
+        assert sent == [
+            ('42', 'Изменился статус проверки работы "hw1". '
+                   + self.HOMEWORK_STATUSES['approved'])
+        ], (
+            'Проверьте, что `async_poll_tenant` отправляет сообщение '
+            'в чат подписки'
+        )
+
+    def test_practicum_client_session(self, monkeypatch, random_timestamp,
+                                      current_timestamp):
+        import homework
+
+        session = homework.make_session(pool_size=4)
+        adapter = session.get_adapter(homework.ENDPOINT)
+        assert adapter._pool_maxsize == 4, (
+            'Проверьте, что `make_session` настраивает размер пула соединений'
+        )
+
+        def mock_response_get(*args, **kwargs):
+            assert 'timeout' in kwargs, (
+                'Проверьте, что запрос к API выполняется с таймаутом'
+            )
+            return MockResponseGET(
+                *args, random_timestamp=random_timestamp,
+                current_timestamp=current_timestamp, **kwargs
+            )
+
+        monkeypatch.setattr(session, 'get', mock_response_get)
+        client = homework.PracticumClient(session, timeout=3)
+        result = homework.fetch_statuses(
+            {'Authorization': 'OAuth tok'}, current_timestamp, client
+        )
+        assert result['current_date'] == random_timestamp
+
+    def test_poll_tenant_advances_cursor(self, monkeypatch, random_timestamp,
+                                         current_timestamp):
+        def mock_response_get(*args, **kwargs):
+            return MockResponseGET(
+                *args, random_timestamp=random_timestamp,
+                current_timestamp=current_timestamp, **kwargs
+            )
+
+        monkeypatch.setattr(requests, 'get', mock_response_get)
+
+        import homework
+
+        bot = MockTelegramBot(token='1234:abcdefg')
+        tenant = homework.Tenant('t', 'tok', '42', current_timestamp)
+        homework.poll_tenant(bot, tenant)
+        assert tenant.from_date == random_timestamp, (
+            'Проверьте, что после успешного запроса временная метка '
+            'подписки сдвигается на `current_date` из ответа API'
+        )
+
+    def test_state_store_roundtrip(self, tmp_path):
+        import homework
+
+        for name in ('state.json', 'state.db'):
+            path = str(tmp_path / name)
+            store = homework.open_state_store(path)
+            store.set_cursor('t', 100)
+            store.set_status('t', 1, 'approved', '2020-02-13T14:40:57Z')
+            store.flush()
+
+            reopened = homework.open_state_store(path)
+            assert reopened.get_cursor('t') == 100, (
+                f'Проверьте, что хранилище `{name}` сохраняет курсор'
+            )
+            assert reopened.get_status('t', 1) == (
+                'approved', '2020-02-13T14:40:57Z'
+            ), (
+                f'Проверьте, что хранилище `{name}` сохраняет статус работы'
+            )
+
+    def test_sqlite_state_store_shared_by_shards(self, tmp_path):
+        import time
+
+        import homework
+
+        path = str(tmp_path / 'state.db')
+        first = homework.SqliteStateStore(path)
+        second = homework.SqliteStateStore(path)
+        first.set_cursor('a', 1)
+        first.set_status('a', 1, 'reviewing', '2020-02-13T14:40:57Z')
+        started = time.monotonic()
+        second.set_cursor('b', 2)
+        second.flush()
+        assert time.monotonic() - started < 1, (
+            'Проверьте, что шард не держит базу состояния заблокированной '
+            'до своей записи'
+        )
+        assert first.get_status('a', 1)[0] == 'reviewing', (
+            'Проверьте, что незаписанные изменения видны до flush()'
+        )
+        first.flush()
+        reopened = homework.SqliteStateStore(path)
+        assert (reopened.get_cursor('a'), reopened.get_cursor('b')) == (
+            1, 2
+        ), (
+            'Проверьте, что шарды с общей базой состояния не теряют '
+            'записи друг друга'
+        )
+
+    def test_poll_tenant_skips_unchanged_status(self, monkeypatch,
+                                                random_timestamp,
+                                                current_timestamp):
+        def mock_response_get(*args, **kwargs):
+            response = MockResponseGET(
+                *args, random_timestamp=current_timestamp,
+                current_timestamp=current_timestamp, **kwargs
+            )
+            response.json = lambda: {
+                'homeworks': [{'id': 1, 'homework_name': 'hw1',
+                               'status': 'reviewing'}],
+                'current_date': current_timestamp
+            }
+            return response
+
+        monkeypatch.setattr(requests, 'get', mock_response_get)
+
+        import homework
+
+        sent = []
+        bot = MockTelegramBot(token='1234:abcdefg')
+        monkeypatch.setattr(
+            bot, 'send_message',
+            lambda chat_id=None, text=None: sent.append(text)
+        )
+        store = homework.open_state_store(None)
+        tenant = homework.Tenant('t', 'tok', '42', current_timestamp)
+        homework.poll_tenant(bot, tenant, store=store)
+        homework.poll_tenant(bot, tenant, store=store)
+        assert len(sent) == 1, (
+            'Проверьте, что повторный статус домашней работы '
+            'не отправляется в Telegram'
+        )
+
+    def test_bot_commands(self, tmp_path):
+        import homework
+
+        store = homework.open_state_store(str(tmp_path / 'state.db'))
+        tenant = homework.Tenant('t', 'tok', '42')
+        store.set_status(tenant.key, 1, 'approved', '2020-02-13T14:40:57Z')
+        commands = homework.BotCommands([tenant], store)
+        assert homework.HOMEWORK_STATUSES['approved'] in commands.handle(
+            42, '/status'
+        ), (
+            'Проверьте, что /status отвечает статусами из хранилища '
+            'состояния'
+        )
+        commands.handle(42, '/pause')
+        assert tenant.active_chat_ids == [], (
+            'Проверьте, что /pause приостанавливает уведомления в чат'
+        )
+        commands.handle(42, '/resume')
+        commands.handle(42, f'/interval {homework.MAX_RETRY_TIME}')
+        homework.schedule_next(tenant, [])
+        assert tenant.active_chat_ids == ['42'], (
+            'Проверьте, что /resume возобновляет уведомления в чат'
+        )
+        assert tenant.interval == homework.MAX_RETRY_TIME, (
+            'Проверьте, что /interval задаёт интервал опроса подписки'
+        )
+
+    def test_reloader_diffs_tenants(self, monkeypatch, tmp_path):
+        import homework
+
+        for name in homework.RELOADABLE + ('config',):
+            monkeypatch.setattr(homework, name.upper(),
+                                getattr(homework, name.upper()))
+        monkeypatch.setattr(homework, 'HOMEWORK_STATUSES',
+                            dict(homework.HOMEWORK_STATUSES))
+        tenants_file = tmp_path / 'tenants.json'
+        statuses_file = tmp_path / 'statuses.json'
+        tenants_file.write_text(json.dumps([
+            {'name': 'a', 'practicum_token': 'tok_a', 'chat_id': '1'},
+            {'name': 'b', 'practicum_token': 'tok_b', 'chat_id': '2'},
+        ]))
+        statuses_file.write_text(json.dumps({'approved': 'Принято!'}))
+        monkeypatch.setattr(homework, 'TENANTS_FILE', str(tenants_file))
+        store = homework.open_state_store(None)
+        tenants = homework.prepare_tenants(store)
+        kept = tenants[0]
+        kept.from_date = 123
+        reloader = homework.Reloader(store, homework.PracticumClient())
+
+        tenants_file.write_text(json.dumps([
+            {'name': 'a', 'practicum_token': 'tok_a', 'chat_id': '3'},
+            {'name': 'c', 'practicum_token': 'tok_c', 'chat_id': '4'},
+        ]))
+        monkeypatch.setenv('TENANTS_FILE', str(tenants_file))
+        monkeypatch.setenv('HOMEWORK_STATUSES_FILE', str(statuses_file))
+        monkeypatch.setenv('RETRY_TIME', '7')
+        dotenv = tmp_path / '.env'
+        dotenv.write_text('RETRY_TIME=9\nREVIEWING_RETRY_TIME=90\n')
+        reloader.dotenv = str(dotenv)
+        reloader.request()
+        assert reloader.due(), (
+            'Проверьте, что SIGHUP запрашивает перезагрузку настроек'
+        )
+        added, removed = reloader.reload(tenants)
+        assert ([t.name for t in added], [t.name for t in removed]) == (
+            ['c'], ['b']
+        ), (
+            'Проверьте, что перезагрузка запускает и останавливает только '
+            'изменившиеся подписки'
+        )
+        assert tenants[0] is kept and kept.from_date == 123, (
+            'Проверьте, что оставшиеся подписки сохраняют своё состояние'
+        )
+        assert kept.chat_id == '3', (
+            'Проверьте, что перезагрузка применяет новый чат подписки'
+        )
+        assert homework.HOMEWORK_STATUSES['approved'] == 'Принято!', (
+            'Проверьте, что перезагрузка применяет тексты статусов'
+        )
+        assert (homework.RETRY_TIME, homework.REVIEWING_RETRY_TIME) == (
+            7, 90
+        ), (
+            'Проверьте, что при перезагрузке, как и при запуске, '
+            'переменные окружения важнее .env'
+        )
+
+    def test_profiler_writes_profiles(self, tmp_path):
+        import threading
+        import time
+
+        import homework
+
+        profiler = homework.Profiler(str(tmp_path), interval=0.001)
+        assert profiler.snapshot() is None, (
+            'Проверьте, что без трассировки памяти снимки не пишутся'
+        )
+        stop = threading.Event()
+        worker = threading.Thread(target=stop.wait, args=(5,))
+        worker.start()
+        profiler.toggle_cpu()
+        time.sleep(0.05)
+        path = profiler.toggle_cpu()
+        stop.set()
+        worker.join()
+        with open(path, encoding='utf-8') as file:
+            assert 'wait (threading.py)' in file.read(), (
+                'Проверьте, что профиль содержит стеки рабочих потоков'
+            )
+        profiler.toggle_memory()
+        try:
+            leak = [bytearray(1000) for _ in range(100)]
+            path = profiler.snapshot()
+        finally:
+            profiler.toggle_memory()
+        with open(path, encoding='utf-8') as file:
+            assert 'test_bot.py' in file.read(), (
+                'Проверьте, что снимок памяти показывает рост по строкам кода'
+            )
+        assert leak
+
+    def test_schedule_next_backoff(self):
+        import homework
+
+        tenant = homework.Tenant('t', 'tok', '42')
+        homework.schedule_next(tenant, [])
+        assert tenant.interval == homework.RETRY_TIME * 2, (
+            'Проверьте, что пустой ответ увеличивает интервал опроса'
+        )
+        homework.schedule_next(
+            tenant, [(homework.Homework(1, 'hw1', 'reviewing'), 'message')]
+        )
+        assert tenant.interval == homework.RETRY_TIME, (
+            'Проверьте, что после взятия работы на проверку '
+            'интервал опроса сокращается'
+        )
+        error = homework.APIResponseError(429, 1000.0)
+        homework.schedule_next(tenant, [], error)
+        assert tenant.interval == 1000.0, (
+            'Проверьте, что соблюдается заголовок Retry-After'
+        )
+
+    def test_send_queue_coalesces_chat_messages(self, monkeypatch):
+        import homework
+
+        sent = []
+        bot = MockTelegramBot(token='1234:abcdefg')
+        monkeypatch.setattr(
+            bot, 'send_message',
+            lambda chat_id=None, text=None: sent.append((chat_id, text))
+        )
+        queue = homework.SendQueue(bot, global_rate=1000, chat_rate=1000)
+        for text in ('first', 'second', 'third'):
+            homework.send_message(queue, '42', text)
+        homework.send_message(queue, '43', 'other')
+        queue.start()
+        queue.stop(timeout=5)
+        assert sent == [('42', 'first\n\nsecond\n\nthird'), ('43', 'other')], (
+            'Проверьте, что очередь склеивает сообщения одного чата '
+            'и отправляет все сообщения перед остановкой'
+        )
+
+    def test_send_queue_does_not_retry_bad_request(self, monkeypatch):
+        import homework
+
+        attempts = []
+
+        def rejected(chat_id=None, text=None):
+            attempts.append(text)
+            raise telegram.error.BadRequest('Chat not found')
+
+        bot = MockTelegramBot(token='1234:abcdefg')
+        monkeypatch.setattr(bot, 'send_message', rejected)
+        queue = homework.SendQueue(bot, chat_rate=1000).start()
+        for number in range(homework.BREAKER_FAILURES + 1):
+            homework.send_message(queue, str(number), 'hi')
+        queue.stop(timeout=5)
+        assert queue.breaker.state == 'closed', (
+            'Проверьте, что сообщения, отклонённые Telegram, не размыкают '
+            'автомат защиты отправки'
+        )
+        assert attempts == ['hi'] * (homework.BREAKER_FAILURES + 1), (
+            'Проверьте, что сообщение, отклонённое Telegram (BadRequest), '
+            'не отправляется повторно'
+        )
+
+    def test_send_queue_requeues_failed_message(self, monkeypatch):
+        import homework
+
+        errors = [telegram.error.NetworkError('down')]
+        sent = []
+
+        def flaky(chat_id=None, text=None):
+            if errors:
+                raise errors.pop(0)
+            sent.append(text)
+
+        bot = MockTelegramBot(token='1234:abcdefg')
+        monkeypatch.setattr(bot, 'send_message', flaky)
+        queue = homework.SendQueue(bot, chat_rate=1000, max_retries=0)
+        queue.start()
+        homework.send_message(queue, '1', 'hi')
+        queue.stop(timeout=5)
+        assert sent == ['hi'], (
+            'Проверьте, что сообщение, не отправленное после всех повторов, '
+            'возвращается в очередь, а не теряется'
+        )
+
+    def test_send_queue_half_open_trial_gets_retry_after(self, monkeypatch):
+        import homework
+
+        errors = [telegram.error.NetworkError('down'),
+                  telegram.error.RetryAfter(0.01)]
+        sent = []
+
+        def flaky(chat_id=None, text=None):
+            if errors:
+                raise errors.pop(0)
+            sent.append(chat_id)
+
+        bot = MockTelegramBot(token='1234:abcdefg')
+        monkeypatch.setattr(bot, 'send_message', flaky)
+        queue = homework.SendQueue(bot, chat_rate=1000)
+        queue.breaker = homework.CircuitBreaker('Telegram', 1, 0.05)
+        queue.start()
+        homework.send_message(queue, '1', 'hi')
+        homework.send_message(queue, '2', 'hi')
+        queue.stop(timeout=5)
+        assert sorted(sent) == ['1', '2'], (
+            'Проверьте, что Retry-After на пробный запрос не оставляет '
+            'автомат защиты полуоткрытым навсегда'
+        )
+        assert queue.breaker.state == 'closed', (
+            'Проверьте, что ответ Telegram с Retry-After замыкает автомат'
+        )
+
+    def test_outbox_redelivers_after_restart(self, monkeypatch, tmp_path):
+        import homework
+
+        def unreachable(chat_id=None, text=None):
+            raise telegram.error.NetworkError('unreachable')
+
+        sent = []
+        bot = MockTelegramBot(token='1234:abcdefg')
+        monkeypatch.setattr(bot, 'send_message', unreachable)
+        path = str(tmp_path / 'outbox.db')
+        queue = homework.SendQueue(bot, max_retries=0,
+                                   outbox=homework.Outbox(path)).start()
+        homework.send_message(queue, '42', 'first')
+        queue.stop(timeout=5)
+
+        monkeypatch.setattr(
+            bot, 'send_message',
+            lambda chat_id=None, text=None: sent.append((chat_id, text))
+        )
+        outbox = homework.Outbox(path)
+        queue = homework.SendQueue(bot, outbox=outbox).start()
+        queue.stop(timeout=5)
+        assert sent == [('42', 'first')], (
+            'Проверьте, что недоставленное сообщение отправляется '
+            'после перезапуска'
+        )
+        assert outbox.pending() == [], (
+            'Проверьте, что доставленное сообщение удаляется из журнала'
+        )
+
+    def test_record_and_replay(self, monkeypatch, tmp_path,
+                               current_timestamp):
+        homeworks = [
+            {'id': i, 'homework_name': f'hw{i}', 'status': status,
+             'date_updated': '2020-02-13T14:40:57Z'}
+            for i, status in enumerate(['reviewing', 'approved', 'rejected'])
+        ]
+
+        def mock_response_get(*args, **kwargs):
+            response = MockResponseGET(
+                *args, random_timestamp=current_timestamp,
+                current_timestamp=current_timestamp, **kwargs
+            )
+            response.headers = {}
+            response.content = json.dumps({
+                'homeworks': homeworks, 'current_date': current_timestamp
+            }).encode()
+            response.json = lambda: json.loads(response.content)
+            return response
+
+        monkeypatch.setattr(requests, 'get', mock_response_get)
+
+        import homework
+
+        path = str(tmp_path / 'cassette.jsonl')
+        tenant = homework.Tenant('t', 'tok', '42', current_timestamp)
+        client = homework.PracticumClient()
+        bot = homework.start_recording(
+            path, MockTelegramBot(token='1234:abcdefg'), client, [tenant]
+        )
+        homework.poll_tenant(bot, tenant, client)
+        homework.poll_tenant(bot, tenant, client)
+        assert 'tok' not in open(path, encoding='utf-8').read(), (
+            'Проверьте, что токен Практикума не попадает в кассету'
+        )
+
+        report = homework.replay(path)
+        assert (report['requests'], report['messages']) == (2, 3), (
+            'Проверьте, что воспроизведение повторяет записанные запросы '
+            'и отправляет записанные сообщения'
+        )
+        assert report['missing'] == report['unexpected'] == 0, (
+            'Проверьте, что воспроизведение отправляет те же сообщения, '
+            'что были записаны'
+        )
+
+    def test_outbox_drops_rejected_message(self, monkeypatch, tmp_path):
+        import homework
+
+        def rejected(chat_id=None, text=None):
+            raise telegram.error.BadRequest('Chat not found')
+
+        bot = MockTelegramBot(token='1234:abcdefg')
+        monkeypatch.setattr(bot, 'send_message', rejected)
+        outbox = homework.Outbox(str(tmp_path / 'outbox.db'))
+        queue = homework.SendQueue(bot, outbox=outbox).start()
+        homework.send_message(queue, 'x', 'hi')
+        queue.stop(timeout=5)
+        assert outbox.pending() == [], (
+            'Проверьте, что отклонённое Telegram сообщение не отправляется '
+            'повторно после перезапуска'
+        )
+        assert outbox.dead_letters() == [(1, 'x', 'hi')], (
+            'Проверьте, что отклонённое сообщение сохраняется в dead_letters'
+        )
+
+    def test_run_pipeline_drains_on_stop(self, monkeypatch, current_timestamp):
+        def mock_response_get(*args, **kwargs):
+            response = MockResponseGET(
+                *args, random_timestamp=current_timestamp,
+                current_timestamp=current_timestamp, **kwargs
+            )
+            response.json = lambda: {
+                'homeworks': [{'id': 1, 'homework_name': 'hw1',
+                               'status': 'approved'}],
+                'current_date': current_timestamp
+            }
+            return response
+
+        monkeypatch.setattr(requests, 'get', mock_response_get)
+
+        import threading
+        import homework
+
+        sent = []
+        bot = MockTelegramBot(token='1234:abcdefg')
+        monkeypatch.setattr(
+            bot, 'send_message',
+            lambda chat_id=None, text=None: sent.append(chat_id)
+        )
+        sender = homework.SendQueue(bot).start()
+        tenants = [
+            homework.Tenant(str(i), f'tok{i}', str(i), current_timestamp)
+            for i in range(3)
+        ]
+        stop_event = threading.Event()
+        threading.Timer(0.3, stop_event.set).start()
+        store = homework.open_state_store(None)
+        flushes = []
+        monkeypatch.setattr(store, 'flush', lambda: flushes.append(1))
+        homework.run_pipeline(
+            sender, tenants, homework.DEFAULT_CLIENT, store, stop_event,
+            workers=2
+        )
+        sender.stop(timeout=5)
+        assert sorted(sent) == ['0', '1', '2'], (
+            'Проверьте, что конвейер опрашивает все подписки и отправляет '
+            'сообщения перед остановкой'
+        )
+        assert len(flushes) == 1, (
+            'Проверьте, что состояние записывается по таймеру и при '
+            'остановке, а не после каждого опроса'
+        )
+
+    def test_scheduler_orders_tenants(self):
+        import homework
+
+        tenants = [homework.Tenant(str(i), f'tok{i}', str(i))
+                   for i in range(4)]
+        scheduler = homework.Scheduler(start_rate=10)
+        scheduler.add(tenants)
+        due = scheduler.next_due()
+        assert scheduler.pop_due(due) is tenants[0], (
+            'Проверьте, что первой опрашивается первая подписка'
+        )
+        assert scheduler.pop_due(due) is None, (
+            'Проверьте, что первые опросы подписок разнесены во времени'
+        )
+        scheduler.remove([tenants[1]])
+        tenants[0].next_poll = due + 10
+        scheduler.push(tenants[0])
+        order = [scheduler.pop_due(due + 100) for _ in range(4)]
+        assert order == [tenants[2], tenants[3], tenants[0], None], (
+            'Проверьте, что подписки извлекаются по времени опроса, '
+            'а удалённые пропускаются'
+        )
+        scheduler.remove([tenants[0]])
+        scheduler.push(tenants[0])
+        assert len(scheduler) == 0, (
+            'Проверьте, что удалённая во время опроса подписка не '
+            'возвращается в очередь'
+        )
+
+    def test_metrics_endpoint(self, monkeypatch, random_timestamp,
+                              current_timestamp):
+        def mock_response_get(*args, **kwargs):
+            return MockResponseGET(
+                *args, random_timestamp=random_timestamp,
+                current_timestamp=current_timestamp, **kwargs
+            )
+
+        monkeypatch.setattr(requests, 'get', mock_response_get)
+
+        import homework
+
+        homework.get_api_answer(current_timestamp)
+        server = homework.start_metrics_server(0)
+        try:
+            body = requests.Session().get(
+                f'http://127.0.0.1:{server.server_port}/metrics'
+            ).text
+        finally:
+            server.shutdown()
+        assert 'practicum_responses_total{code="200"}' in body, (
+            'Проверьте, что ответы API учитываются в метриках'
+        )
+        assert 'practicum_request_seconds_count' in body, (
+            'Проверьте, что длительность запросов к API попадает в метрики'
+        )
+
+    def test_json_log_formatter(self):
+        import json
+        import logging
+        import homework
+
+        record = logging.LogRecord(
+            'homework', logging.INFO, __file__, 1, 'Сообщение', None, None
+        )
+        record.tenant = 'student'
+        record.latency = 0.25
+        data = json.loads(homework.JsonFormatter().format(record))
+        assert data['message'] == 'Сообщение'
+        assert data['tenant'] == 'student', (
+            'Проверьте, что JSON-формат лога переносит поле `tenant`'
+        )
+        assert data['latency'] == 0.25
+
+    def test_stream_homeworks(self, random_timestamp):
+        import json
+        import homework
+
+        data = {
+            'homeworks': [
+                {'id': i, 'homework_name': f'hw{i}', 'status': 'approved',
+                 'reviewer_comment': 'Всё нравится'}
+                for i in range(50)
+            ],
+            'current_date': random_timestamp
+        }
+        body = json.dumps(data, ensure_ascii=False).encode()
+        chunks = [body[i:i + 7] for i in range(0, len(body), 7)]
+        meta = {}
+        homeworks = list(homework.stream_homeworks(chunks, meta))
+        assert [hw.name for hw in homeworks] == [
+            hw['homework_name'] for hw in data['homeworks']
+        ], (
+            'Проверьте, что потоковый разбор возвращает все домашние работы'
+        )
+        assert meta['current_date'] == random_timestamp, (
+            'Проверьте, что потоковый разбор сохраняет `current_date`'
+        )
+        try:
+            list(homework.stream_homeworks(
+                [json.dumps({'current_date': 1}).encode()], {}
+            ))
+        except KeyError:
+            pass
+        else:
+            assert False, (
+                'Убедитесь, что потоковый разбор выбрасывает ошибку, '
+                'когда ответ не содержит ключа `homeworks`'
+            )
+
+    def test_check_response_builds_homework_records(self):
+        import homework
+
+        records = homework.check_response({
+            'homeworks': [{'id': 7, 'homework_name': 'hw7',
+                           'status': 'rejected'}],
+            'current_date': 0
+        })
+        record = records[0]
+        assert isinstance(record, homework.Homework), (
+            'Проверьте, что `check_response` возвращает записи `Homework`'
+        )
+        assert not hasattr(record, '__dict__'), (
+            'Проверьте, что `Homework` использует `__slots__`'
+        )
+        assert record.kind is homework.HomeworkStatus.REJECTED
+        assert homework.parse_status(record) == (
+            'Изменился статус проверки работы "hw7". '
+            + self.HOMEWORK_STATUSES['rejected']
+        )
+
+    def test_group_tenants_by_token(self):
+        import homework
+
+        tenants = homework.group_tenants([
+            homework.Tenant('a', 'shared', '1'),
+            homework.Tenant('b', 'shared', '2'),
+            homework.Tenant('c', 'shared', '1'),
+            homework.Tenant('d', 'own', '2'),
+        ])
+        assert [tenant.name for tenant in tenants] == ['a', 'd'], (
+            'Проверьте, что подписки с одним токеном опрашиваются один раз'
+        )
+        assert tenants[0].chat_ids == ['1', '2'], (
+            'Проверьте, что уведомления по общему токену уходят во все чаты '
+            'без повторов'
+        )
+        reordered = homework.group_tenants([
+            homework.Tenant('b', 'shared', '2'),
+            homework.Tenant('a', 'shared', '1'),
+        ])
+        assert reordered[0].key == tenants[0].key, (
+            'Проверьте, что состояние общей подписки не зависит от порядка '
+            'записей в реестре'
+        )
+
+    def test_hash_ring_moves_few_tenants(self):
+        import homework
+
+        tokens = [f'token{i}' for i in range(1000)]
+        before = [homework.HashRing(4).shard(token) for token in tokens]
+        after = [homework.HashRing(5).shard(token) for token in tokens]
+        assert set(before) == {0, 1, 2, 3}, (
+            'Проверьте, что подписки распределяются по всем процессам'
+        )
+        moved = sum(old != new for old, new in zip(before, after))
+        assert moved < len(tokens) / 3, (
+            'Проверьте, что при добавлении процесса переезжает лишь '
+            'часть подписок'
+        )
+
+    def test_response_cache_skips_unchanged_body(self):
+        import homework
+
+        class Response:
+            status_code = HTTPStatus.OK
+            headers = {'ETag': '"v1"'}
+
+            def __init__(self, current_date):
+                self.content = (
+                    '{"homeworks": [], "current_date": %d}' % current_date
+                ).encode()
+
+        cache = homework.ResponseCache()
+        assert cache.unchanged('t', Response(1)) is None
+        cache.commit('t')
+        assert cache.request_headers('t') == {'If-None-Match': '"v1"'}, (
+            'Проверьте, что ETag ответа используется в условном запросе'
+        )
+        assert cache.unchanged('t', Response(2)) == {'current_date': 2}, (
+            'Проверьте, что ответ, отличающийся только `current_date`, '
+            'считается неизменным'
+        )
+
+    def test_response_cache_keeps_unprocessed_response(self, monkeypatch,
+                                                       current_timestamp):
+        body = json.dumps({
+            'homeworks': [
+                {'id': 1, 'homework_name': 'hw1', 'status': 'approved'},
+                {'id': 2, 'homework_name': 'hw2', 'status': 'unknown'},
+            ],
+            'current_date': current_timestamp + 1,
+        })
+
+        def mock_response_get(*args, **kwargs):
+            response = MockResponseGET(
+                *args, random_timestamp=current_timestamp,
+                current_timestamp=current_timestamp, **kwargs
+            )
+            response.headers = {}
+            response.content = body.encode()
+            response.json = lambda: json.loads(body)
+            return response
+
+        monkeypatch.setattr(requests, 'get', mock_response_get)
+
+        import homework
+
+        sent = []
+        bot = MockTelegramBot(token='1234:abcdefg')
+        monkeypatch.setattr(
+            bot, 'send_message',
+            lambda chat_id=None, text=None: sent.append(text)
+        )
+        client = homework.PracticumClient()
+        tenant = homework.Tenant('t', 'tok', '42', current_timestamp)
+        homework.poll_tenant(bot, tenant, client)
+        homework.poll_tenant(bot, tenant, client)
+        assert homework.RECOVERYMESSAGE not in sent, (
+            'Проверьте, что ответ, обработка которого прервалась, '
+            'не считается неизменным при следующем запросе'
+        )
+        assert tenant.from_date == current_timestamp, (
+            'Проверьте, что временная метка не сдвигается, пока ответ '
+            'не обработан'
+        )
+
+    def test_circuit_breaker_and_single_alert(self, monkeypatch,
+                                              random_timestamp,
+                                              current_timestamp):
+        calls = []
+
+        def mock_500_response_get(*args, **kwargs):
+            calls.append(1)
+            return MockResponseGET(
+                *args, random_timestamp=random_timestamp,
+                current_timestamp=current_timestamp,
+                http_status=HTTPStatus.INTERNAL_SERVER_ERROR, **kwargs
+            )
+
+        monkeypatch.setattr(requests, 'get', mock_500_response_get)
+
+        import homework
+
+        sent = []
+        bot = MockTelegramBot(token='1234:abcdefg')
+        monkeypatch.setattr(
+            bot, 'send_message',
+            lambda chat_id=None, text=None: sent.append(text)
+        )
+        client = homework.PracticumClient()
+        client.breaker = homework.CircuitBreaker('test', 2, 60)
+        tenant = homework.Tenant('t', 'tok', '42', current_timestamp)
+        for _ in range(4):
+            homework.poll_tenant(bot, tenant, client)
+        assert len(calls) == 2, (
+            'Проверьте, что после серии сбоев запросы к API '
+            'не выполняются, пока автомат разомкнут'
+        )
+        assert len(sent) == 1, (
+            'Проверьте, что о затяжном сбое отправляется одно сообщение'
+        )